@@ -0,0 +1,116 @@
+import argparse
+import numpy as np
+
+SML_COLUMNS = ['SML_ID', 'SMF_ID_REFS', 'database_identifier', 'chemical_formula', 'smiles', 'inchi', 'chemical_name',
+               'uri', 'theoretical_neutral_mass', 'adduct_ions', 'reliability', 'best_id_confidence_measure',
+               'best_id_confidence_value']
+SMF_COLUMNS = ['SMF_ID', 'SME_ID_REFS', 'SME_ID_REF_ambiguity_code', 'adduct_ion', 'isotopomer', 'exp_mass_to_charge',
+               'charge', 'retention_time_in_seconds', 'retention_time_in_seconds_start',
+               'retention_time_in_seconds_end']
+SME_COLUMNS = ['SME_ID', 'evidence_input_id', 'database_identifier', 'chemical_formula', 'smiles', 'inchi',
+               'chemical_name', 'uri', 'derivatized_form', 'adduct_ion', 'exp_mass_to_charge', 'charge',
+               'theoretical_mass_to_charge', 'spectra_ref', 'identification_method', 'ms_level',
+               'id_confidence_measure[1]', 'rank']
+
+
+def generate(path, samples=10, assays=None, ms_runs=None, sml=1000, smf=None, sme=None, mgf=100, peaks=20,
+             keys=3, missing=0.2, seed=0):
+    """
+    Writes a synthetic mzTab-M file to path. assays are spread over the samples and the ms_runs round robin, every
+    sample description has keys key:value pairs, the first being patientid with two samples per patient, and a
+    fraction missing of the abundances is null. smf and sme default to the number of SML rows, mgf is the number
+    of spectra in the MGF block and peaks the number of peaks of each spectrum. Returns the size of the file.
+    """
+    assays = samples if assays is None else assays
+    ms_runs = assays if ms_runs is None else ms_runs
+    smf = sml if smf is None else smf
+    sme = smf if sme is None else sme
+    rng = np.random.default_rng(seed)
+
+    with open(path, 'w') as f:
+        def write(*lines):
+            f.write('\n'.join(lines) + '\n')
+
+        write('MTD\tmzTab-version\t2.0.0-M', 'MTD\tmzTab-ID\tBENCHMARK', 'MTD\tdescription\tsynthetic benchmark file')
+        for i in range(1, ms_runs + 1):
+            write('MTD\tms_run[%d]-location\tfile:///data/run%d.mzML' % (i, i),
+                  'MTD\tms_run[%d]-format\t[MS, MS:1000584, mzML file, ]' % i,
+                  'MTD\tms_run[%d]-id_format\t[MS, MS:1000774, multiple peak list nativeID format, ]' % i)
+        for i in range(1, samples + 1):
+            description = ['patientid:P%d' % ((i - 1) // 2 + 1)]
+            description += ['key%d:value%d' % (k, i % (k + 2)) for k in range(1, keys)]
+            write('MTD\tsample[%d]\tsample %d' % (i, i),
+                  'MTD\tsample[%d]-description\t%s' % (i, ' | '.join(description[:keys])))
+        for i in range(1, assays + 1):
+            write('MTD\tassay[%d]\tassay %d' % (i, i),
+                  'MTD\tassay[%d]-sample_ref\tsample[%d]' % (i, (i - 1) % samples + 1),
+                  'MTD\tassay[%d]-ms_run_ref\tms_run[%d]' % (i, (i - 1) % ms_runs + 1))
+        write('MTD\tstudy_variable[1]\tall samples',
+              'MTD\tstudy_variable[1]-assay_refs\t' + '|'.join('assay[%d]' % i for i in range(1, assays + 1)),
+              'MTD\tsmall_molecule-quantification_unit\t[MS, MS:1001841, LC-MS label-free quantitation analysis, ]',
+              'MTD\tsmall_molecule-identification_reliability\t[MS, MS:1002955, hr-ms compound identification, ]',
+              'MTD\tid_confidence_measure[1]\t[MS, MS:1002890, fragmentation score, ]',
+              '')
+
+        abundances = ['abundance_assay[%d]' % i for i in range(1, assays + 1)]
+
+        def abundance(n):
+            values = rng.uniform(1e3, 1e7, n).round(4)
+            return ['null' if m else repr(v) for v, m in zip(values.tolist(), rng.random(n) < missing)]
+
+        write('\t'.join(['SMH'] + SML_COLUMNS + abundances
+                        + ['abundance_study_variable[1]', 'abundance_variation_study_variable[1]']))
+        for j in range(1, sml + 1):
+            write('\t'.join(['SML', str(j), str((j - 1) % max(smf, 1) + 1), 'HMDB%07d' % j, 'C6H12O6', 'null',
+                             'null', 'compound %d' % j, 'null', '180.06339', '[M+H]1+', '2',
+                             '[MS, MS:1002890, fragmentation score, ]', '0.9']
+                            + abundance(assays) + abundance(1) + ['null']))
+        write('')
+
+        write('\t'.join(['SFH'] + SMF_COLUMNS + abundances))
+        mz = rng.uniform(100, 1000, smf).round(5).tolist()
+        rt = rng.uniform(30, 900, smf).round(2).tolist()
+        for j in range(1, smf + 1):
+            write('\t'.join(['SMF', str(j), str((j - 1) % max(sme, 1) + 1), 'null', '[M+H]1+', 'null', repr(mz[j - 1]),
+                             '1', repr(rt[j - 1]), repr(round(rt[j - 1] - 3, 2)), repr(round(rt[j - 1] + 3, 2))]
+                            + abundance(assays)))
+        write('')
+
+        write('\t'.join(['SEH'] + SME_COLUMNS))
+        for j in range(1, sme + 1):
+            write('\t'.join(['SME', str(j), 'feature_%d' % j, 'HMDB%07d' % j, 'C6H12O6', 'null', 'null',
+                             'compound %d' % j, 'null', 'null', '[M+H]1+', '181.0707', '1', '181.07066',
+                             'ms_run[%d]:index=%d' % ((j - 1) % ms_runs + 1, j), '[MS, MS:1001477, SpectraST, ]',
+                             '[MS, MS:1000511, ms level, 2]', repr(round(rng.uniform(), 4)), '1']))
+        write('')
+
+        for k in range(1, mgf + 1):
+            write('COM\tMGF\tBEGIN IONS', 'COM\tMGF\tFEATURE_ID=%d' % ((k - 1) % max(smf, 1) + 1),
+                  'COM\tMGF\tTITLE=spectrum %d' % k, 'COM\tMGF\tSCANS=%d' % k,
+                  'COM\tMGF\tPEPMASS=%s' % repr(round(rng.uniform(100, 1000), 5)), 'COM\tMGF\tCHARGE=1+')
+            for m, i in zip(np.sort(rng.uniform(50, 1000, peaks)).round(4).tolist(),
+                            rng.uniform(1, 1e5, peaks).round(1).tolist()):
+                write('COM\tMGF\t%s %s' % (repr(m), repr(i)))
+            write('COM\tMGF\tEND IONS')
+
+        return f.tell()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writes a synthetic mzTab-M file')
+    parser.add_argument('path')
+    parser.add_argument('--samples', type=int, default=10)
+    parser.add_argument('--assays', type=int, default=None)
+    parser.add_argument('--ms-runs', type=int, default=None)
+    parser.add_argument('--sml', type=int, default=1000)
+    parser.add_argument('--smf', type=int, default=None)
+    parser.add_argument('--sme', type=int, default=None)
+    parser.add_argument('--mgf', type=int, default=100)
+    parser.add_argument('--peaks', type=int, default=20)
+    parser.add_argument('--keys', type=int, default=3)
+    parser.add_argument('--missing', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    size = generate(args.path, args.samples, args.assays, args.ms_runs, args.sml, args.smf, args.sme, args.mgf,
+                    args.peaks, args.keys, args.missing, args.seed)
+    print('Wrote', args.path, round(size / 1e6, 1), 'MB')
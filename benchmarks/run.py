@@ -0,0 +1,189 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # no ru_maxrss on windows
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+from pymztab.mztab import mzTab
+from generate import generate
+
+# arguments of generate() for the files of the benchmarks
+PRESETS = {
+    'small': dict(samples=10, sml=1000, mgf=100),
+    'medium': dict(samples=100, sml=10000, mgf=1000),
+    'large': dict(samples=200, sml=50000, mgf=5000),
+    'wide': dict(samples=2000, assays=4000, sml=2000, mgf=100, keys=8),
+}
+
+
+def _loaded(**kwargs):
+    def setup(path, out):
+        m = mzTab(path)
+        m.load(**kwargs)
+        return m
+    return setup
+
+
+def _new(path, out):
+    return mzTab(path)
+
+
+def _lazy(m, path, out):
+    m.load(lazy=True)
+    m.samples, m.assays
+
+
+def _iter_smf(m, path, out):
+    for chunk in m.iter_smf(chunksize=10000):
+        pass
+
+
+def _delete(m, path, out):
+    m.samples_delete('patientid', ['P1'])
+    m.save(os.path.join(out, 'delete.mzTab'))
+
+
+def _nullify(m, path, out):
+    m.samples_nullify('patientid', ['P1'])
+    m.save(os.path.join(out, 'nullify.mzTab'))
+
+
+def _update(incremental):
+    def operation(m, path, out):
+        m.samples_update('key1', 'updated')
+        m.save(os.path.join(out, 'update.mzTab'), incremental=incremental)
+    return operation
+
+
+# name: (setup, timed operation), setup is not timed and runs again before every repetition
+OPERATIONS = {
+    'load': (_new, lambda m, path, out: m.load()),
+    'load_typed': (_new, lambda m, path, out: m.load(typed=True)),
+    'load_stream': (_new, lambda m, path, out: m.load(stream=True)),
+    'load_lazy': (_new, _lazy),
+    'iter_smf': (_new, _iter_smf),
+    'save': (_loaded(), lambda m, path, out: m.save(os.path.join(out, 'save.mzTab'))),
+    'save_typed': (_loaded(typed=True), lambda m, path, out: m.save(os.path.join(out, 'save.mzTab'))),
+    'save_update': (_loaded(), _update(False)),
+    'save_incremental': (_loaded(), _update(True)),
+    'samples_delete': (_loaded(), _delete),
+    'samples_nullify': (_loaded(), _nullify),
+    'save_slices': (_loaded(), lambda m, path, out: m.save_slices(os.path.join(out, 'slice'))),
+    'export_dataset': (_loaded(), lambda m, path, out: m.export_dataset(os.path.join(out, 'dataset'))),
+}
+
+
+def _measure(name, path, repeat, trace):
+    # runs in a fresh process, so that the memory of one operation does not leak into the next
+    setup, operation = OPERATIONS[name]
+    times = []
+    peak = None
+    with tempfile.TemporaryDirectory() as out, contextlib.redirect_stdout(io.StringIO()):
+        for i in range(repeat + int(trace)):
+            state = setup(path, out)
+            # the last repetition measures the peak of python allocations, it is slower and not timed
+            tracing = trace and i == repeat
+            if tracing:
+                tracemalloc.start()
+            start = time.perf_counter()
+            operation(state, path, out)
+            elapsed = time.perf_counter() - start
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                times.append(elapsed)
+            del state
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource is not None else None
+    return times, peak, rss
+
+
+def run(path, operations=None, repeat=3, trace=True):
+    """
+    Times every operation on the mzTab file path, each in its own process, and returns a list of dicts with the
+    best and median wall time in seconds, the throughput in MB/s of the file size over the median time, the peak
+    of python allocations measured by tracemalloc and the maximum resident memory of the process in bytes.
+    """
+    size = os.path.getsize(path)
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for name in operations or OPERATIONS:
+        with context.Pool(1) as pool:
+            times, peak, rss = pool.apply(_measure, (name, path, repeat, trace))
+        median = statistics.median(times)
+        results.append({'operation': name, 'best': min(times), 'median': median,
+                        'mb_per_s': size / 1e6 / median if median > 0 else None,
+                        'peak_memory': peak, 'max_rss': rss})
+    return results
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'pandas': pd.__version__, 'machine': platform.machine(),
+            'cpus': os.cpu_count()}
+
+
+def _mb(n):
+    return '-' if n is None else '%.1f' % (n / 1e6)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the load, save and slice operations of pymztab')
+    parser.add_argument('--preset', choices=sorted(PRESETS), action='append',
+                        help='size of the synthetic file, can be repeated (default: small)')
+    parser.add_argument('--file', action='append', default=[], help='benchmark an existing mzTab file instead')
+    parser.add_argument('--operation', choices=list(OPERATIONS), action='append',
+                        help='operation to time, can be repeated (default: all)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-trace', action='store_true', help='skip the tracemalloc run of every operation')
+    parser.add_argument('--data', default=None, help='directory of the synthetic files, reused if they exist')
+    parser.add_argument('--output', default=None, help='append the results as JSON lines to this file')
+    args = parser.parse_args()
+
+    data = args.data or os.path.join(tempfile.gettempdir(), 'pymztab-benchmarks')
+    os.makedirs(data, exist_ok=True)
+    files = [(path, os.path.basename(path)) for path in args.file]
+    for preset in args.preset or ([] if files else ['small']):
+        path = os.path.join(data, preset + '.mzTab')
+        if not os.path.exists(path):
+            generate(path, **PRESETS[preset])
+        files.append((path, preset))
+
+    environment = _environment()
+    for path, label in files:
+        print('%s: %s, %s MB' % (label, path, _mb(os.path.getsize(path))))
+        print('%-16s %9s %9s %9s %10s %10s' % ('operation', 'best s', 'median s', 'MB/s', 'peak MB', 'rss MB'))
+        results = run(path, args.operation, args.repeat, not args.no_trace)
+        for r in results:
+            print('%-16s %9.3f %9.3f %9.1f %10s %10s' % (r['operation'], r['best'], r['median'], r['mb_per_s'] or 0,
+                                                     _mb(r['peak_memory']), _mb(r['max_rss'])))
+        if args.output is not None:
+            with open(args.output, 'a') as f:
+                for r in results:
+                    f.write(json.dumps(dict(environment, file=label, size=os.path.getsize(path),
+                                            params=PRESETS.get(label), **r)) + '\n')
+        print()
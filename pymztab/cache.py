@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import pandas as pd
+
+from .mgf import MGFStore
+
+try:
+    from pyarrow import feather
+    FORMAT = 'arrow'
+except ImportError:
+    # without pyarrow the tables are pickled
+    FORMAT = 'pkl'
+
+# version of the layout of the entries, part of their key so that entries of older versions are not restored
+VERSION = 2
+TABLES = ['samples', 'assays', 'sml', 'smf', 'sme']
+# sections of mzTab.lines whose rows live in the tables and are not cached as text
+TABLE_ROWS = ['sml', 'smf', 'sme']
+MGF_FILE = 'mgf.bin'
+
+
+class mzTabCache(object):
+    """
+    On-disk cache of parsed mzTab files. Every entry is a directory holding the tables in Arrow IPC (Feather)
+    format, or pickled if pyarrow is not installed, the passthrough lines needed by save() and the bytes of the
+    mgf lines. Entries are keyed by
+    the absolute path, size and mtime of the file, by the typed flag of the load and, with hash=True, by the
+    sha256 of the content. When the cache grows above max_size bytes the least recently used entries are removed.
+    """
+    def __init__(self, directory=None, max_size=10 * 1024 ** 3, hash=False):
+        if directory is None:
+            directory = os.environ.get('PYMZTAB_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'pymztab'))
+        self.directory = directory
+        self.max_size = max_size
+        self.hash = hash
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, file, typed=False):
+        # name of the entry of a file
+        stat = os.stat(file)
+        tokens = [str(VERSION), os.path.abspath(file), str(stat.st_size), str(stat.st_mtime_ns), str(bool(typed))]
+        if self.hash:
+            sha = hashlib.sha256()
+            with open(file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(chunk)
+            tokens.append(sha.hexdigest())
+        return hashlib.sha1('\t'.join(tokens).encode()).hexdigest()
+
+    def restore(self, mztab, typed=False):
+        """
+        Fills mztab from the cache and returns True, or returns False if the file is not cached, or if its entry
+        can't be read, e.g. because another process evicts it meanwhile.
+        """
+        entry = os.path.join(self.directory, self.key(mztab.file, typed))
+        meta_file = os.path.join(entry, 'meta.json')
+        if not os.path.exists(meta_file):
+            return False
+        # everything is read before mztab is filled, that is left untouched if the entry is incomplete
+        try:
+            with open(meta_file, 'r') as f:
+                meta = json.load(f)
+            frames = {name: _read_frame(os.path.join(entry, name + '.' + meta['format']), meta['format'])
+                      for name in meta['tables']}
+            mgf = None
+            if meta['mgf']:
+                with open(os.path.join(entry, MGF_FILE), 'rb') as f:
+                    mgf = f.read()
+        except (OSError, ValueError, KeyError, EOFError):
+            return False
+        unpack(mztab, meta, frames.get, mgf)
+
+        # mark the entry as recently used
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return True
+
+    def store(self, mztab, typed=False):
+        """
+        Stores the parsed tables, the passthrough lines and the mgf of mztab, then evicts the least recently used
+        entries. Returns False if the entry could not be written, e.g. on a full disk: the cache is only an
+        optimization and mztab stays loaded.
+        """
+        meta, frames, mgf = pack(mztab)
+        meta['format'] = FORMAT
+
+        key = self.key(mztab.file, typed)
+        try:
+            tmp = tempfile.mkdtemp(dir=self.directory, prefix='.' + key)
+        except OSError:
+            return False
+        try:
+            for name, df in frames.items():
+                _write_frame(df, os.path.join(tmp, name + '.' + FORMAT))
+            if mgf is not None:
+                with open(os.path.join(tmp, MGF_FILE), 'wb') as f:
+                    f.write(mgf)
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+
+            entry = os.path.join(self.directory, key)
+            if os.path.exists(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                # another process stored the same file between the rmtree and the rename: its entry is as good
+                shutil.rmtree(tmp, ignore_errors=True)
+                if not os.path.exists(os.path.join(entry, 'meta.json')):
+                    return False
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return False
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        self.evict()
+        return True
+
+    def entries(self):
+        """
+        Returns a list of (entry, size in bytes, last use) of the cached files, least recently used first.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if name.startswith('.') or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                entries.append((entry, size, os.stat(entry).st_mtime))
+            except OSError:
+                # removed by another process meanwhile
+                continue
+        entries.sort(key=lambda x: x[2])
+        return entries
+
+    def evict(self):
+        # remove the least recently used entries until the cache fits in max_size
+        if self.max_size is None:
+            return
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for entry, size, _ in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for entry, _, _ in self.entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def pack(mztab):
+    """
+    Splits a loaded mztab in a json serializable dict of its passthrough lines, a dict of its tables, with the
+    index of samples and assays as their first column, so that they can be stored or sent as Arrow data, and the
+    bytes of its mgf lines, or None.
+    """
+    # keep only the lines that are not table rows, and renumber self.lines accordingly
+    txt = []
+    lines = {section: [] for section in mztab.lines}
+    for section, indexes in mztab.lines.items():
+        if section in TABLE_ROWS:
+            continue
+        for i in indexes:
+            lines[section].append(len(txt))
+            txt.append(mztab.txt[i])
+    # the mgf lines stay one block of bytes, as kept by mztab in a MGFStore
+    mgf = None if mztab.mgf is None else mztab.mgf.raw
+
+    meta = {'txt': txt, 'lines': lines, 'tables': {}, 'mgf': mgf is not None}
+    frames = {}
+    for name in TABLES:
+        df = getattr(mztab, name)
+        if df is None:
+            continue
+        if name in ('samples', 'assays'):
+            meta['tables'][name] = df.index.name
+            df = df.reset_index(names='__index__')
+        else:
+            meta['tables'][name] = False
+        frames[name] = df
+    return meta, frames, mgf
+
+
+def unpack(mztab, meta, read, mgf=None):
+    """
+    Fills mztab from the output of pack(), read(name) returning the DataFrame of the table name, and mgf the
+    bytes of the mgf lines.
+    """
+    mztab.txt = meta['txt']
+    mztab.lines = meta['lines']
+    for name in TABLES:
+        if name not in meta['tables']:
+            setattr(mztab, name, None)
+            continue
+        df = read(name)
+        if meta['tables'][name] is not False:
+            # restore the index of samples and assays
+            df.set_index(df.columns[0], inplace=True)
+            df.index.name = meta['tables'][name]
+        setattr(mztab, name, df)
+    mztab.mgf = None if mgf is None else MGFStore(mgf)
+
+
+def _write_frame(df, path):
+    if path.endswith('.arrow'):
+        # uncompressed, so that reading maps the buffers instead of decompressing them
+        feather.write_feather(df, path, compression='uncompressed')
+    else:
+        df.to_pickle(path)
+
+
+def _read_frame(path, format):
+    if format == 'arrow':
+        return feather.read_table(path, memory_map=True).to_pandas()
+    return pd.read_pickle(path)
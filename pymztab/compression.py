@@ -0,0 +1,117 @@
+import collections
+import concurrent.futures
+import gzip
+import io
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    # without zstandard only gzip compressed files can be read and written
+    zstandard = None
+
+# first bytes and file extensions of the supported compressions
+MAGIC = {'gzip': b'\x1f\x8b', 'zstd': b'\x28\xb5\x2f\xfd'}
+EXTENSIONS = {'.gz': 'gzip', '.gzip': 'gzip', '.zst': 'zstd', '.zstd': 'zstd'}
+LEVELS = {'gzip': 6, 'zstd': 3}
+# uncompressed bytes of every gzip member, compressed in parallel
+BLOCK_SIZE = 1 << 22
+
+
+def detect(path):
+    # compression of an existing file from its first bytes, None if it is not compressed
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    for name, magic in MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def from_extension(path):
+    # compression of a file to write from its extension, None for any other extension
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def open_text(path, mode='r', compression=None, threads=None):
+    """
+    Opens path as text in mode 'r' or 'w', compressed or not. When reading, the compression is found from the first
+    bytes of the file. When writing, it is compression, 'gzip' or 'zstd', or else found from the extension of path
+    (.gz or .zst), and the compression runs on threads threads, all the cpus by default.
+    """
+    if mode == 'r':
+        compression = detect(path)
+    elif compression is None:
+        compression = from_extension(path)
+    if compression is None:
+        return open(path, mode)
+    if compression not in MAGIC:
+        raise ValueError('Unknown compression: ' + str(compression))
+    if compression == 'zstd' and zstandard is None:
+        raise ImportError('zstandard is needed to read and write zstd compressed files: pip install zstandard')
+
+    if mode == 'r':
+        if compression == 'gzip':
+            return io.TextIOWrapper(gzip.open(path, 'rb'))
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True)
+        return io.TextIOWrapper(io.BufferedReader(reader, 1 << 20))
+    threads = threads or os.cpu_count() or 1
+    if compression == 'gzip':
+        return io.TextIOWrapper(_GzipWriter(path, LEVELS['gzip'], threads))
+    # zstd compresses in the calling thread with threads=0
+    compressor = zstandard.ZstdCompressor(level=LEVELS['zstd'], threads=threads if threads > 1 else 0)
+    return io.TextIOWrapper(compressor.stream_writer(open(path, 'wb')))
+
+
+def _gzip_member(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+class _GzipWriter(io.BufferedIOBase):
+    # a gzip file written as a series of members of BLOCK_SIZE uncompressed bytes each, compressed by a pool of
+    # threads since zlib releases the GIL. The concatenated members are read as one file by gzip, zcat or pigz.
+    def __init__(self, path, level, threads):
+        self.f = open(path, 'wb')
+        self.level = level
+        self.threads = threads
+        self.pool = concurrent.futures.ThreadPoolExecutor(threads) if threads > 1 else None
+        self.pending = collections.deque()
+        self.buffer = bytearray()
+        self.members = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= BLOCK_SIZE:
+            self.__submit(bytes(self.buffer[:BLOCK_SIZE]))
+            del self.buffer[:BLOCK_SIZE]
+        return len(data)
+
+    def __submit(self, data):
+        self.members += 1
+        if self.pool is None:
+            self.f.write(_gzip_member(data, self.level))
+            return
+        self.pending.append(self.pool.submit(_gzip_member, data, self.level))
+        # write the members in order as they are done, with at most two per thread in memory
+        while len(self.pending) > 2 * self.threads or (len(self.pending) > 0 and self.pending[0].done()):
+            self.f.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            # an empty file is still one empty member
+            if len(self.buffer) > 0 or self.members == 0:
+                self.__submit(bytes(self.buffer))
+            while len(self.pending) > 0:
+                self.f.write(self.pending.popleft().result())
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+            self.f.close()
+            super().close()
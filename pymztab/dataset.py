@@ -0,0 +1,137 @@
+import json
+import os
+import shutil
+import urllib.parse
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    # datasets can't be written nor read without pyarrow
+    pyarrow = None
+
+# version of the layout of the datasets, in their dataset.json
+VERSION = 1
+LAYOUTS = ['long', 'wide']
+# directory name of the rows whose partition value is missing, read back as null by pyarrow
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def _check():
+    if pyarrow is None:
+        raise ImportError('pyarrow is needed to write and read datasets: pip install pymztab[arrow]')
+
+
+def _write(df, path, schema=None):
+    pq.write_table(pyarrow.Table.from_pandas(df, schema=schema, preserve_index=False), path)
+
+
+def _partition_dir(key, value):
+    # hive style directory of a partition value, escaped like pyarrow does, e.g. patientid=P1
+    if value is None or value != value:
+        return key + '=' + NULL_PARTITION
+    return key + '=' + urllib.parse.quote(str(value), safe='')
+
+
+def write_dataset(directory, samples, assays, tables, partition=None, layout='long'):
+    """
+    Writes the tables of a mzTab as a Parquet dataset in directory, see mzTab.export_dataset(). samples and assays
+    are the tables of mzTab, and tables maps 'sml', 'smf' and 'sme' to (name of the id column, the other columns,
+    and the float64 abundances with one column per assay of assays, or None).
+    """
+    _check()
+    if layout not in LAYOUTS:
+        raise ValueError('Unknown layout: ' + str(layout) + ', expected one of ' + ', '.join(LAYOUTS))
+    os.makedirs(directory, exist_ok=True)
+
+    # partition value of every assay, from its sample
+    samples = samples.rename_axis('sample_id').reset_index()
+    assays = assays.rename_axis('assay_id').reset_index()
+    if partition is not None:
+        assays[partition] = assays['sample_ref'].map(samples.set_index('sample_id')[partition]).to_numpy()
+        groups = assays.groupby(partition, sort=False, dropna=False).indices
+    else:
+        groups = {None: np.arange(len(assays))}
+    _write(samples, os.path.join(directory, 'samples.parquet'))
+    _write(assays, os.path.join(directory, 'assays.parquet'))
+
+    ids = dict()
+    for name, (id_column, annotations, abundances) in tables.items():
+        ids[name] = id_column
+        _write(annotations, os.path.join(directory, name + '.parquet'))
+        path = os.path.join(directory, name + '_abundance')
+        # the partitions of a previous export would be read with the new ones
+        shutil.rmtree(path, ignore_errors=True)
+        if abundances is None:
+            continue
+        values = abundances.to_numpy(dtype=np.float64)
+        row_ids = annotations[id_column]
+        # every partition of the long layout has the same schema, also those without any abundance
+        id_type = pyarrow.int64() if pd.api.types.is_integer_dtype(row_ids.dtype) else pyarrow.string()
+        schema = pyarrow.schema([(id_column, id_type), ('assay_id', pyarrow.string()),
+                                 ('sample_id', pyarrow.string()), ('abundance', pyarrow.float64())])
+        for value, positions in groups.items():
+            folder = path if partition is None else os.path.join(path, _partition_dir(partition, value))
+            os.makedirs(folder, exist_ok=True)
+            if layout == 'long':
+                # one row per non null abundance, sorted by row of the table and then by assay
+                block = values[:, positions]
+                rows, columns = np.nonzero(~np.isnan(block))
+                df = pd.DataFrame({id_column: row_ids.iloc[rows].to_numpy(),
+                                   'assay_id': assays['assay_id'].to_numpy()[positions][columns],
+                                   'sample_id': assays['sample_ref'].to_numpy()[positions][columns],
+                                   'abundance': block[rows, columns]})
+            else:
+                df = pd.DataFrame(values[:, positions], columns=['abundance_' + str(assay_id) for assay_id
+                                                                 in assays['assay_id'].to_numpy()[positions]])
+                df.insert(0, id_column, row_ids.to_numpy())
+            _write(df, os.path.join(folder, 'part-0.parquet'), schema if layout == 'long' else None)
+
+    with open(os.path.join(directory, 'dataset.json'), 'w') as f:
+        json.dump({'version': VERSION, 'partition': partition, 'layout': layout, 'ids': ids}, f)
+
+
+def read_dataset(directory, table='sml', filters=None, columns=None):
+    """
+    Reads a table of a dataset written by mzTab.export_dataset() as a DataFrame: 'samples', 'assays', 'sml',
+    'smf' or 'sme' for the tables without their abundance_assay columns, or 'sml_abundance' and 'smf_abundance'
+    for the abundances, one row per abundance in the long layout, or the id and abundance_assay columns of the
+    assays of the partitions read in the wide layout. filters is a pyarrow.dataset expression or a list of
+    (column, op, value) tuples like in pyarrow.parquet, e.g. [('patientid', '=', 'P1')]: only the partitions and
+    the row groups that may match are read. columns restricts the columns read.
+    """
+    _check()
+    with open(os.path.join(directory, 'dataset.json'), 'r') as f:
+        meta = json.load(f)
+    if isinstance(filters, list):
+        filters = pq.filters_to_expression(filters)
+    if not table.endswith('_abundance'):
+        return pq.read_table(os.path.join(directory, table + '.parquet'), columns=columns,
+                             filters=filters).to_pandas()
+
+    path = os.path.join(directory, table)
+    partition = meta['partition']
+    partitioning = None
+    if partition is not None:
+        # partition values are read as text, whatever they look like
+        partitioning = ds.partitioning(pyarrow.schema([(partition, pyarrow.string())]), flavor='hive')
+    dataset = ds.dataset(path, format='parquet', partitioning=partitioning)
+    if meta['layout'] == 'long':
+        return dataset.to_table(columns=columns, filter=filters).to_pandas()
+
+    # every partition holds the columns of its own assays: the partitions are read one by one and joined on the id
+    id_column = meta['ids'][table[:-len('_abundance')]]
+    fragments = list(dataset.get_fragments(filter=filters))
+    schema = pyarrow.unify_schemas([fragment.physical_schema for fragment in fragments] + [dataset.schema])
+    frames = []
+    for fragment in fragments:
+        names = [name for name in fragment.physical_schema.names
+                 if name == id_column or columns is None or name in columns]
+        df = fragment.to_table(schema=schema, columns=names, filter=filters).to_pandas()
+        frames.append(df.set_index(id_column))
+    if len(frames) == 0:
+        return pd.DataFrame(columns=[id_column])
+    return pd.concat(frames, axis=1).reset_index()
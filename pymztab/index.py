@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+
+def _numbers(column):
+    # float64 values of a column read as text or typed, NaN where it is not a number
+    return pd.to_numeric(column, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+class _Ids(object):
+    # hash index of an id column, a duplicated id finds its first row
+    def __init__(self, ids):
+        values = _numbers(ids)
+        first = ~pd.Series(values).duplicated().to_numpy()
+        self.index = pd.Index(values[first])
+        self.positions = np.flatnonzero(first)
+
+    def find(self, ids):
+        # positions of the rows with the given ids, -1 for the ids not found
+        found = self.index.get_indexer(ids)
+        return np.where(found >= 0, self.positions[found], -1)
+
+
+class _Sorted(object):
+    # positions of the rows of a table sorted by a numeric column, for range queries by binary search
+    def __init__(self, values):
+        self.column = values
+        self.order = np.argsort(values, kind='stable')
+        self.values = values[self.order]
+
+    def between(self, low, high):
+        # positions of the rows with low <= value <= high, NaN is sorted last and never matches
+        return self.order[np.searchsorted(self.values, low, 'left'):np.searchsorted(self.values, high, 'right')]
+
+
+class _Refs(object):
+    # hash index of an id column, and the rows of another table referenced by the | separated ids of a ref column
+    def __init__(self, ids, refs, targets):
+        self.rows = _Ids(ids)
+        exploded = pd.Series(refs.to_numpy(dtype=object)).astype(str).str.split('|').explode()
+        values = _numbers(exploded.str.strip())
+        found = _Ids(targets).find(values)
+        # null refs would find the rows with a null id
+        keep = (found >= 0) & ~np.isnan(values)
+        rows = exploded.index.to_numpy()[keep]
+        self.targets = found[keep]
+        self.offsets = np.zeros(len(refs) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(refs)), out=self.offsets[1:])
+
+    def lookup(self, ids):
+        # positions of the rows referenced by the rows with the given ids
+        try:
+            ids = np.atleast_1d(np.asarray(ids, dtype=np.float64))
+        except (TypeError, ValueError):
+            ids = _numbers(pd.Series(np.atleast_1d(np.asarray(ids, dtype=object))))
+        rows = self.rows.find(ids)
+        return self.referenced(rows[rows >= 0])
+
+    def referenced(self, rows):
+        # positions of the rows referenced by the rows at the given positions
+        if len(rows) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate([self.targets[self.offsets[i]:self.offsets[i + 1]] for i in rows]))
+
+
+class FeatureIndex(object):
+    """
+    Indexes of the SML, SMF and SME tables of a mzTab: the SMF rows sorted by exp_mass_to_charge and by
+    retention_time_in_seconds, searched by bisection, and hash indexes of SML_ID, SMF_ID and SME_ID with the rows
+    their SMF_ID_REFS and SME_ID_REFS point to. Every index is built on first use, and built again if the table
+    it was built from is replaced or changes length, or after clear(). Edits in place that keep the length of a
+    table, e.g. m.smf.loc[...] = ..., are not seen: mzTab.mark_changed() clears the indexes.
+    """
+    def __init__(self, mztab):
+        self.mztab = mztab
+        self.indexes = dict()
+
+    def clear(self):
+        # the indexes are built again by the next query
+        self.indexes.clear()
+
+    def __get(self, name, tables, build):
+        # the tables without their pending masks, that never touch the indexed columns
+        frames = [self.mztab._unmasked(table)[0] for table in tables]
+        key = [(id(df), None if df is None else len(df)) for df in frames]
+        if name not in self.indexes or self.indexes[name][0] != key:
+            self.indexes[name] = (key, build(*frames) if all(df is not None for df in frames) else None)
+        return self.indexes[name][1]
+
+    def mz(self):
+        return self.__get('mz', ['smf'], lambda smf: _Sorted(_numbers(smf['exp_mass_to_charge'])))
+
+    def rt(self):
+        return self.__get('rt', ['smf'], lambda smf: _Sorted(_numbers(smf['retention_time_in_seconds'])))
+
+    def sml_smf(self):
+        return self.__get('sml_smf', ['sml', 'smf'],
+                          lambda sml, smf: _Refs(sml['SML_ID'], sml['SMF_ID_REFS'], smf['SMF_ID']))
+
+    def smf_sme(self):
+        return self.__get('smf_sme', ['smf', 'sme'],
+                          lambda smf, sme: _Refs(smf['SMF_ID'], smf['SME_ID_REFS'], sme['SME_ID']))
+
+    def features_in_window(self, mz, tol_ppm=10, rt_range=None):
+        # positions of the SMF rows within tol_ppm of mz, and with their retention time in rt_range if given
+        if mz is None and rt_range is None:
+            raise ValueError('features_in_window needs mz or rt_range')
+        if mz is not None:
+            tol = abs(mz) * tol_ppm * 1e-6
+            index = self.mz()
+            rows = index.between(mz - tol, mz + tol) if index is not None else np.zeros(0, dtype=np.int64)
+            if rt_range is not None and len(rows) > 0:
+                values = self.rt().column[rows]
+                rows = rows[(values >= rt_range[0]) & (values <= rt_range[1])]
+        else:
+            index = self.rt()
+            rows = index.between(*rt_range) if index is not None else np.zeros(0, dtype=np.int64)
+        return np.sort(rows)
+
+    def features_for(self, sml_ids):
+        # positions of the SMF rows referenced by the SML rows with the given SML_ID
+        index = self.sml_smf()
+        return index.lookup(sml_ids) if index is not None else np.zeros(0, dtype=np.int64)
+
+    def evidence_for(self, sml_ids):
+        # positions of the SME rows referenced by the SMF rows of the SML rows with the given SML_ID
+        index, features = self.smf_sme(), self.features_for(sml_ids)
+        if index is None or len(features) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return index.referenced(features)
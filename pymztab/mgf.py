@@ -0,0 +1,156 @@
+import io
+import numpy as np
+import pandas as pd
+
+PREFIX = b'COM\tMGF\t'
+BEGIN = b'BEGIN IONS'
+# header keys that identify a spectrum, looked up by get()
+ID_KEYS = ['TITLE', 'SPECTRUMID', 'SCANS']
+
+
+class MGFStore(object):
+    """
+    The MGF spectra embedded in the COM MGF lines of a mzTab. The lines are kept as one block of bytes and
+    written back verbatim, and they are parsed on first use into the m/z and intensity of all the peaks, as two
+    contiguous float32 arrays, offsets, the position of the first peak of every spectrum in them, and headers,
+    a table of the KEY=value lines of every spectrum. Spectra are looked up by TITLE, SPECTRUMID or SCANS with
+    get(), and by the FEATURE_ID that refers to their SMF row with for_feature().
+    """
+    def __init__(self, raw):
+        # raw is the bytes, or a bytearray, of the lines, separated by single newlines
+        self.raw = raw
+        self._records = None
+        self._headers = None
+        self._offsets = None
+        self._mz = None
+        self._intensity = None
+        self._ids = None
+        self._features = None
+
+    @classmethod
+    def from_lines(cls, lines):
+        return cls('\n'.join(lines).encode())
+
+    @classmethod
+    def from_bytes(cls, data):
+        # lines as read from the file, with their newlines. A bytearray is trimmed in place, not copied.
+        if b'\r' in data:
+            data = data.replace(b'\r\n', b'\n')
+        if not isinstance(data, bytearray):
+            return cls(data.rstrip(b'\n'))
+        while len(data) > 0 and data[-1] == 10:
+            del data[-1:]
+        return cls(data)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __parse(self):
+        data = np.frombuffer(self.raw, dtype=np.uint8)
+        # first byte of every line, of its text after COM\tMGF\t and of its end
+        starts = np.concatenate(([0], np.flatnonzero(data == 10) + 1))
+        ends = np.append(starts[1:] - 1, len(data))
+        text = starts + len(PREFIX)
+        first = data[np.minimum(text, len(data) - 1)] if len(data) > 0 else data
+        # spectrum of every line, from a BEGIN IONS line to the next one
+        begins = np.array([start for start, t in zip(starts[first == ord('B')].tolist(), text[first == ord('B')].tolist())
+                           if self.raw[t:t + len(BEGIN)] == BEGIN], dtype=np.int64)
+        spectra = np.searchsorted(begins, starts, side='right') - 1
+        peak = (text < ends) & (spectra >= 0) & (((first >= ord('0')) & (first <= ord('9'))) | (first == ord('.'))
+                                                 | (first == ord('-')) | (first == ord('+')))
+
+        # the peak lines with their prefix blanked out, parsed at once by the C reader of pandas
+        buffer = data.copy()
+        for k in range(len(PREFIX)):
+            buffer[starts[peak] + k] = ord(' ')
+        keep = np.repeat(peak, np.append(np.diff(starts), len(data) - starts[-1]) if len(data) > 0 else 0)
+        values = pd.read_csv(io.BytesIO(buffer[keep].tobytes()), sep=r'\s+', header=None, names=[0, 1, 2],
+                             dtype={0: np.float64, 1: np.float64, 2: object}, engine='c') if peak.any() else None
+        self._mz = np.zeros(0, np.float32) if values is None else values[0].to_numpy(np.float32)
+        self._intensity = np.zeros(0, np.float32) if values is None else values[1].to_numpy(np.float32)
+        self._offsets = np.zeros(len(begins) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(spectra[peak], minlength=len(begins)), out=self._offsets[1:])
+
+        # KEY=value lines of every spectrum
+        self._records = [dict() for _ in range(len(begins))]
+        header = (text < ends) & (spectra >= 0) & ~peak
+        for start, end, i in zip(text[header].tolist(), ends[header].tolist(), spectra[header].tolist()):
+            key, equal, value = self.raw[start:end].partition(b'=')
+            if equal:
+                self._records[i][key.decode()] = value.decode()
+
+    @property
+    def headers(self):
+        if self._headers is None:
+            self._headers = pd.DataFrame(self.records, dtype=object)
+        return self._headers
+
+    @property
+    def records(self):
+        # the header values of every spectrum, as dicts
+        if self._records is None:
+            self.__parse()
+        return self._records
+
+    @property
+    def offsets(self):
+        if self._offsets is None:
+            self.__parse()
+        return self._offsets
+
+    @property
+    def mz(self):
+        if self._mz is None:
+            self.__parse()
+        return self._mz
+
+    @property
+    def intensity(self):
+        if self._intensity is None:
+            self.__parse()
+        return self._intensity
+
+    def spectrum(self, i):
+        """
+        The i-th spectrum, as a dict of its header values and its mz and intensity arrays, views of the store.
+        """
+        start, end = self.offsets[i], self.offsets[i + 1]
+        spectrum = dict(self.records[i])
+        spectrum['mz'] = self.mz[start:end]
+        spectrum['intensity'] = self.intensity[start:end]
+        return spectrum
+
+    def get(self, spectrum_id):
+        """
+        The spectrum whose TITLE, SPECTRUMID or SCANS is spectrum_id. Raises KeyError if there is none.
+        """
+        if self._ids is None:
+            self._ids = dict()
+            for key in ID_KEYS:
+                for i, record in enumerate(self.records):
+                    if key in record:
+                        self._ids.setdefault(record[key], i)
+        return self.spectrum(self._ids[str(spectrum_id)])
+
+    def for_feature(self, feature_id):
+        """
+        The list of the spectra whose FEATURE_ID is feature_id, the SMF_ID of a feature.
+        """
+        if self._features is None:
+            self._features = dict()
+            for i, record in enumerate(self.records):
+                if 'FEATURE_ID' in record:
+                    self._features.setdefault(record['FEATURE_ID'], []).append(i)
+        return [self.spectrum(i) for i in self._features.get(str(feature_id), [])]
+
+    def lines(self):
+        return self.raw.decode().split('\n') if len(self.raw) > 0 else []
+
+    def blocks(self, size=1 << 24):
+        # the text of the lines in blocks of about size bytes cut at newlines, to be written without copying it all
+        start = 0
+        while start < len(self.raw):
+            end = self.raw.find(b'\n', start + size)
+            end = len(self.raw) if end == -1 else end
+            yield self.raw[start:end].decode()
+            start = end + 1
@@ -1,12 +1,808 @@
+import concurrent.futures
+import csv
+import hashlib
 import importlib
+import io
+import itertools
+import mmap
+import multiprocessing
+import os
+import re
+import time
+import traceback
+from collections import namedtuple
+import numpy as np
 import pandas as pd
+from .cache import mzTabCache, pack, unpack
+from .compression import detect, open_text
+from .dataset import read_dataset, write_dataset
+from .index import FeatureIndex
+from .mgf import MGFStore
+from .stats import NO_PHASE, Profiler
+
+try:
+    import pyarrow
+    from pyarrow import ipc
+except ImportError:
+    # without pyarrow load_many sends the tables pickled
+    pyarrow = None
+
+# public names of the module. read_dataset is imported for the users of export_dataset, to read back its dataset
+__all__ = ['mzTab', 'LoadResult', 'load_many', 'merge', 'read_dataset', 'mzTabCache']
+
+# dtypes of the mzTab-M 2.0 table columns, used by load(typed=True). Columns that are not listed stay strings.
+SML_DTYPES = {'SML_ID': 'Int64', 'best_id_confidence_value': 'float64'}
+SMF_DTYPES = {'SMF_ID': 'Int64', 'SME_ID_REF_ambiguity_code': 'Int64', 'exp_mass_to_charge': 'float64',
+              'charge': 'Int64', 'retention_time_in_seconds': 'float64',
+              'retention_time_in_seconds_start': 'float64', 'retention_time_in_seconds_end': 'float64'}
+SME_DTYPES = {'SME_ID': 'Int64', 'exp_mass_to_charge': 'float64', 'charge': 'Int64',
+              'theoretical_mass_to_charge': 'float64', 'rank': 'Int64'}
+TABLE_DTYPES = {'sml': SML_DTYPES, 'smf': SMF_DTYPES, 'sme': SME_DTYPES}
+# mgf lines encoded at once by the default load
+MGF_BATCH = 10000
+# indexed columns, e.g. abundance_assay[1] or id_confidence_measure[1]
+FLOAT_COLUMNS = re.compile(r'^(abundance_assay|abundance_study_variable|abundance_variation_study_variable|'
+                           r'id_confidence_measure)\[\d+\]$')
+# tokens read as missing values in numeric columns. NaN has to be listed since keep_default_na is off.
+NUMERIC_NA = ['null', 'NaN', 'nan']
+
+
+def _table_dtypes(section, columns):
+    # dtype schema of a table section for the given header columns
+    dtypes = dict()
+    for col in columns:
+        if col in TABLE_DTYPES[section]:
+            dtypes[col] = TABLE_DTYPES[section][col]
+        elif FLOAT_COLUMNS.match(col):
+            dtypes[col] = 'float64'
+        else:
+            dtypes[col] = object
+    return dtypes
+
+
+def _read_table(txt, section, columns, usecols=None, typed=True):
+    # parse a tab separated block of table rows with the C reader of pandas, using the mzTab-M dtypes, or keeping
+    # every cell as text with typed=False. usecols is the list of the columns to parse, all of them by default.
+    if usecols is not None:
+        usecols = set(usecols)
+        missing = usecols.difference(columns)
+        if len(missing) > 0:
+            raise KeyError('Columns not found in the ' + section.upper() + ' header: ' + ', '.join(sorted(missing)))
+    names = [col for col in columns if usecols is None or col in usecols]
+    dtypes = _table_dtypes(section, names) if typed else {col: object for col in names}
+    if len(txt) == 0:
+        return pd.DataFrame([], columns=names).astype(dtypes)
+    kwargs = dict(sep='\t', header=None, names=columns, usecols=names if usecols is not None else None,
+                  index_col=False, quoting=csv.QUOTE_NONE, keep_default_na=False, engine='c')
+    buffer = io.BytesIO if isinstance(txt, bytes) else io.StringIO
+    if not typed:
+        return pd.read_csv(buffer(txt), dtype=object, na_filter=False, **kwargs)
+
+    kwargs['na_values'] = {col: NUMERIC_NA if dtype != object else ['null'] for col, dtype in dtypes.items()}
+    try:
+        return pd.read_csv(buffer(txt), dtype=dtypes, **kwargs)
+    except ValueError:
+        # a numeric column holds something that is not a number: read everything as strings and only convert
+        # the columns that can be converted
+        df = pd.read_csv(buffer(txt), dtype=object, **kwargs)
+        for col, dtype in dtypes.items():
+            if dtype != object:
+                try:
+                    df[col] = pd.to_numeric(df[col]).astype(dtype)
+                except (ValueError, TypeError):
+                    pass
+        return df
+
+
+def _iter_lines(mm, ranges, chunksize):
+    # blocks of at most chunksize lines from byte ranges of a memory map
+    for start, end in ranges:
+        pos = start
+        while pos < end:
+            stop = pos
+            for _ in range(chunksize):
+                stop = mm.find(b'\n', stop, end)
+                if stop == -1:
+                    stop = end
+                    break
+                stop += 1
+                if stop >= end:
+                    break
+            yield mm[pos:stop]
+            pos = stop
+
+
+# references to the entities renumbered by save()
+ENTITY_REF = re.compile(r'^(sample|ms_run|assay)\[\d+\]$')
+
+
+def _parse_mtd(line):
+    # (entity id, property, value) of a MTD line, e.g. ('sample[1]', '-description', 'patientid:P1') for
+    # MTD\tsample[1]-description\tpatientid:P1. value is None if the line has no value.
+    tokens = line.split('\t', 2)
+    entity_id = tokens[1].split(']')[0] + ']'
+    return entity_id, tokens[1][len(entity_id):], tokens[2] if len(tokens) > 2 else None
+
+
+def _remap_refs(value, ids):
+    # sample, ms_run and assay references of a (| separated) value mapped through ids. References to entities that
+    # are not in ids are not written anymore, and are removed.
+    refs = []
+    removed = False
+    for ref in value.split('|'):
+        key = ref.strip()
+        if ENTITY_REF.match(key):
+            if key not in ids:
+                removed = True
+                continue
+            ref = ref.replace(key, ids[key])
+        refs.append(ref)
+    if len(refs) == 0:
+        return 'null'
+    return '|'.join(refs).strip() if removed else '|'.join(refs)
+
+
+def _renumber(samples, assays):
+    # old -> new ids of the samples, ms_runs and assays that are written, numbered from 1 in the order of the tables
+    ids = dict()
+    for i, sample_id in enumerate(samples.index, 1):
+        ids[sample_id] = 'sample[' + str(i) + ']'
+    for i, ms_run in enumerate(assays['ms_run_ref'].unique(), 1):
+        ids[ms_run] = 'ms_run[' + str(i) + ']'
+    for i, assay_id in enumerate(assays.index, 1):
+        ids[assay_id] = 'assay[' + str(i) + ']'
+    return ids
+
+
+class _Metadata(object):
+    # the MTD lines of a mzTab, with the sample, ms_run and assay lines parsed once and grouped by entity id
+    def __init__(self, txt, lines):
+        self.rest = [txt[i] for i in lines['rest']]
+        self.entities = dict()
+        for section in ('samples', 'ms_runs', 'assays'):
+            for i in lines[section]:
+                entity_id, prop, value = _parse_mtd(txt[i])
+                self.entities.setdefault(entity_id, []).append((prop, value))
+
+    def lines(self, samples, assays, ids):
+        # the rest lines followed by the lines of the samples, ms_runs and assays to write, renumbered through ids
+        new_txt = self.rest_lines(ids)
+        new_txt.append('')
+        new_txt.extend(self.entity_lines(samples.index, ids, samples['description']))
+        new_txt.append('')
+        new_txt.extend(self.entity_lines(assays['ms_run_ref'].unique(), ids))
+        new_txt.append('')
+        new_txt.extend(self.entity_lines(assays.index, ids))
+        return new_txt
+
+    def rest_lines(self, ids):
+        return [self.__remap(line, ids) for line in self.rest]
+
+    def entity_lines(self, entity_ids, ids, descriptions=None):
+        # lines of the entities, with the descriptions of the samples table if given
+        if descriptions is None:
+            descriptions = [None] * len(entity_ids)
+        new_lines = []
+        for entity_id, description in zip(entity_ids, descriptions):
+            new_lines.extend(self.__entity_lines(entity_id, ids, description))
+        return new_lines
+
+    def __entity_lines(self, entity_id, ids, description=None):
+        new_id = ids[entity_id]
+        new_lines = []
+        described = False
+        for prop, value in self.entities.get(entity_id, []):
+            if prop == '-description' and description is not None:
+                # the description from the samples table
+                value = description
+                described = True
+            elif value is not None and (prop.endswith('_ref') or prop.endswith('_refs')):
+                value = _remap_refs(value, ids)
+            new_lines.append('MTD\t' + new_id + prop + ('\t' + value if value is not None else ''))
+        if isinstance(description, str) and description != '' and not described:
+            # a sample that had no description line was given one by samples_update
+            new_lines.append('MTD\t' + new_id + '-description\t' + description)
+        return new_lines
+
+    @staticmethod
+    def __remap(line, ids):
+        # references in the other MTD lines, e.g. study_variable[1]-assay_refs
+        if not line.startswith('MTD\t') or '_ref' not in line:
+            return line
+        tokens = line.split('\t', 2)
+        if len(tokens) < 3 or not (tokens[1].endswith('_ref') or tokens[1].endswith('_refs')):
+            return line
+        return tokens[0] + '\t' + tokens[1] + '\t' + _remap_refs(tokens[2], ids)
+
+
+def _fingerprint(df):
+    # hash of the columns, dtypes, index and cells of a table, that changes when the table is edited in place.
+    # Text columns are hashed as tuples of str, far faster than by pandas, and the others by pandas.
+    hashes = [tuple(df.columns), tuple(map(str, df.dtypes)), _hash_values(df.index)]
+    for i in range(df.shape[1]):
+        hashes.append(_hash_values(df.iloc[:, i]))
+    return tuple(hashes)
+
+
+def _hash_values(values):
+    if values.dtype == object:
+        try:
+            return hash(tuple(values.tolist()))
+        except TypeError:
+            pass
+    rows = pd.util.hash_pandas_object(values, index=False, categorize=False).to_numpy()
+    return hashlib.sha1(rows.tobytes()).hexdigest()
+
+
+def _typed_column(column, dtype):
+    # a column of a table read as text or typed, with the dtype of load(typed=True) and null as a missing value
+    if dtype == object:
+        return column.where(~column.isin(['null', 'None']), None) if column.dtype == object else column
+    if column.dtype == object:
+        column = pd.to_numeric(column.where(~column.isin(['null', 'None']), None), errors='coerce')
+    try:
+        return column.astype(dtype)
+    except (TypeError, ValueError):
+        # e.g. charges that are not integers
+        return column
+
+
+def _abundances(df, tags, nulls):
+    # float64 abundances of a table in the columns tags, NaN for the nullified and the missing columns
+    present = [tag for tag in tags if tag in df.columns and tag not in nulls]
+    values = df[present].to_numpy(dtype=object)
+    values[pd.isna(values) | (values == 'null') | (values == 'None')] = np.nan
+    try:
+        values = values.astype(np.float64)
+    except (TypeError, ValueError):
+        values = np.column_stack([pd.to_numeric(df[tag], errors='coerce').to_numpy(dtype=np.float64)
+                                  for tag in present]) if len(present) > 0 else values.astype(np.float64)
+    return pd.DataFrame(values, columns=present).reindex(columns=tags)
+
+
+def _dataset_table(df, section, nulls, assay_ids):
+    # (id column, the other columns typed, the abundances of the assays) of a table, as write_dataset takes them.
+    # The first column, SMH, SFH or SEH, only holds the line prefix.
+    others = [col for col in df.columns[1:] if not col.startswith('abundance_assay[')]
+    dtypes = _table_dtypes(section, others)
+    annotations = pd.DataFrame({col: _typed_column(df[col], dtypes[col]) for col in others})
+    abundances = None
+    if len(others) < df.shape[1]:
+        abundances = _abundances(df, ['abundance_' + str(assay_id) for assay_id in assay_ids], nulls)
+    return TABLE_IDS[section][0], annotations, abundances
+
+
+def _assay_columns(df, tags):
+    # header names and positions of the columns of a table to write, keeping only the abundance_assay columns in tags
+    names, columns = [], []
+    for j, col in enumerate(df.columns):
+        if col.startswith('abundance_assay['):
+            if col not in tags:
+                continue
+            col = tags[col]
+        names.append(col)
+        columns.append(j)
+    return names, columns
+
+
+# number of cells formatted at once when a table is written
+CHUNK_CELLS = 2000000
+
+
+def _format_frame(df):
+    # cells of a table as text, one list per column. Missing values and None written as text are null, floats are
+    # written with their shortest repr and infinities as INF, as in the mzTab spec. The float columns are taken out
+    # of the table together as one 2d array.
+    cells = [None] * df.shape[1]
+    floats = [j for j, dtype in enumerate(df.dtypes) if dtype == np.float64]
+    if len(floats) > 0:
+        values = df.iloc[:, floats].to_numpy(dtype=np.float64).T
+        special = ~np.isfinite(values)
+        for k, (j, column) in enumerate(zip(floats, values.tolist())):
+            cells[j] = list(map(repr, column))
+            for i in np.flatnonzero(special[k]):
+                value = column[i]
+                cells[j][i] = 'null' if value != value else ('INF' if value > 0 else '-INF')
+    for j in range(df.shape[1]):
+        if cells[j] is None:
+            cells[j] = _format_column(df.iloc[:, j])
+    return cells
+
+
+def _format_column(column):
+    # cells of a column that is not float64 as text, see _format_frame
+    text = column.astype(str).to_numpy(dtype=object)
+    text[column.isna().to_numpy()] = 'null'
+    if column.dtype == object:
+        text[text == 'None'] = 'null'
+    return text.tolist()
+
+
+def _write_table(writer, df, nulls, tags):
+    # serializes the header and rows of a table to a _LineWriter, a chunk of rows at a time. Only the abundance_assay
+    # columns in tags are written, renamed to their value, and the columns in nulls are written as null.
+    names, columns = _assay_columns(df, tags)
+    writer.line('\t'.join(names))
+    formatted = [j for j in columns if df.columns[j] not in nulls]
+    step = max(1000, CHUNK_CELLS // max(1, len(formatted)))
+    for start in range(0, len(df), step):
+        cells = iter(_format_frame(df.iloc[start:start + step, formatted]))
+        pieces = [itertools.repeat('null') if df.columns[j] in nulls else next(cells) for j in columns]
+        writer.block('\n'.join(map('\t'.join, zip(*pieces))))
+
+
+class _LineWriter(object):
+    # writes lines to a file as they come, separated by newlines, dropping every empty line that follows another one
+    def __init__(self, f):
+        self.f = f
+        self.first = True
+        self.empty = False
+        # characters written, newlines included
+        self.size = 0
+
+    def line(self, line):
+        if line == '' and self.empty:
+            return
+        if not self.first:
+            self.f.write('\n')
+            self.size += 1
+        self.f.write(line)
+        self.size += len(line)
+        self.first = False
+        self.empty = line == ''
+
+    def lines(self, lines):
+        for line in lines:
+            self.line(line)
+
+    def block(self, text):
+        # non-empty lines already joined by newlines
+        if text == '':
+            return
+        if not self.first:
+            self.f.write('\n')
+            self.size += 1
+        self.f.write(text)
+        self.size += len(text)
+        self.first = False
+        self.empty = False
+
+    def copy(self, fd, start, end):
+        # non-empty lines copied from the bytes [start, end) of the file descriptor fd, without their last newline
+        if start == end:
+            return
+        if not self.first:
+            self.f.write('\n')
+            self.size += 1
+        _copy_range(fd, self.f, start, end)
+        self.size += end - start
+        self.first = False
+        self.empty = False
+
+
+COPY_SIZE = 1 << 24
+
+
+def _same_file(a, b):
+    return os.path.exists(a) and os.path.exists(b) and os.path.samefile(a, b)
+
+
+def _copy_range(fd, f, start, end):
+    # appends the bytes [start, end) of the file descriptor fd to the file f, in the kernel with copy_file_range or
+    # sendfile where the system supports them between files, else with buffered reads
+    f.flush()
+    if not isinstance(getattr(f.buffer, 'raw', None), io.FileIO):
+        # a compressed file, the bytes go through its compressor
+        while start < end:
+            data = os.pread(fd, min(end - start, COPY_SIZE), start)
+            f.buffer.write(data)
+            start += len(data)
+        return
+    out = f.fileno()
+    while start < end:
+        n = 0
+        try:
+            if hasattr(os, 'copy_file_range'):
+                n = os.copy_file_range(fd, out, min(end - start, COPY_SIZE), start)
+            elif hasattr(os, 'sendfile'):
+                n = os.sendfile(out, fd, start, min(end - start, COPY_SIZE))
+        except OSError:
+            n = 0
+        if n == 0:
+            n = os.write(out, os.pread(fd, min(end - start, COPY_SIZE), start))
+        start += n
+
+
+class _SourceFile(object):
+    # the loaded file, whose unchanged sections save(incremental=True) copies instead of writing them from the
+    # tables. It is not used if the file changed since the load or if it is the file being saved.
+    def __init__(self, mztab, filename):
+        self.mztab = mztab
+        self.f = None
+        self.mm = None
+        if filename is None or mztab._source is None or not os.path.exists(mztab.file):
+            return
+        if _same_file(filename, mztab.file) or detect(mztab.file) is not None:
+            return
+        f = open(mztab.file, 'rb')
+        stat = os.fstat(f.fileno())
+        if (stat.st_size, stat.st_mtime_ns) != mztab._source or stat.st_size == 0:
+            f.close()
+            return
+        self.f = f
+        if mztab.index is not None:
+            self.index = mztab.index
+        else:
+            # find the sections of a file loaded entirely
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.index = _index_file(self.mm, [], {section: [] for section in mztab.lines})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if self.mm is not None:
+            self.mm.close()
+        if self.f is not None:
+            self.f.close()
+
+    def clean(self, name, tags=None):
+        # whether a table, or the mgf lines, did not change since the load and can be copied
+        if self.f is None or name in self.mztab._changed or name in self.mztab._masks or len(self.index[name]) == 0:
+            return False
+        # a table handed out since the load may have been edited in place
+        fingerprint = self.mztab._fingerprints.get(name)
+        if fingerprint is not None and fingerprint != _fingerprint(self.mztab.__dict__.get(name)):
+            return False
+        mm = self.mm if self.mm is not None else self.mztab._mmap
+        # lines ending with \r\n are read as \n by the other loads
+        if any(mm.find(b'\r', start, end) != -1 for start, end in self.index[name]):
+            return False
+        # every abundance_assay column must be kept with its number
+        return name not in TABLE_HEADERS or all(not col.startswith('abundance_assay[') or tags.get(col) == col
+                                                for col in self.__header(name).split('\t'))
+
+    def copy(self, writer, name):
+        # writes the header and rows of a table, or the mgf lines, as they are in the file
+        mm = self.mm if self.mm is not None else self.mztab._mmap
+        if name in TABLE_HEADERS:
+            writer.line(self.__header(name))
+        for start, end in self.index[name]:
+            writer.copy(self.f.fileno(), start, end - 1 if mm[end - 1:end] == b'\n' else end)
+
+    def __header(self, name):
+        return self.mztab.txt[self.mztab.lines[TABLE_HEADERS[name]][0]]
+
+
+class _TableSlicer(object):
+    # a table converted to text once, from which the columns of any subset of its assays can be cut. Runs of
+    # columns that are not abundance_assay[n] are joined once per row.
+    def __init__(self, df, nulls=()):
+        self.pieces = []
+        names, cells = [], []
+        # the columns in nulls are not formatted, they are written as null
+        keep = [j for j, col in enumerate(df.columns) if col not in nulls]
+        formatted = iter(_format_frame(df if len(keep) == df.shape[1] else df.iloc[:, keep]))
+        for col in df.columns:
+            text = next(formatted) if col not in nulls else None
+            if col.startswith('abundance_assay['):
+                self.__add_run(names, cells)
+                names, cells = [], []
+                self.pieces.append((col, text, True))
+            else:
+                names.append(col)
+                cells.append(text)
+        self.__add_run(names, cells)
+
+    def __add_run(self, names, cells):
+        if len(names) > 0:
+            self.pieces.append(('\t'.join(names), list(map('\t'.join, zip(*cells))), False))
+
+    def write(self, writer, tags):
+        # writes the header and rows of the table, keeping the assay columns in tags renamed to their value
+        names, cells = [], []
+        for name, piece, assay in self.pieces:
+            if assay:
+                if name not in tags:
+                    continue
+                name = tags[name]
+            names.append(name)
+            cells.append(piece if piece is not None else itertools.repeat('null'))
+        writer.line('\t'.join(names))
+        writer.block('\n'.join(map('\t'.join, zip(*cells))))
+
+
+# the _SliceWriter of the running save_slices, inherited by forked workers
+_SLICE_WRITER = None
+
+
+def _write_slice(s):
+    if _SLICE_WRITER is None:
+        raise RuntimeError('The worker was not forked by save_slices and has no slices to write')
+    return _SLICE_WRITER.write(s)
+
+
+class _SliceWriter(object):
+    # everything save_slices needs to write any of its slices, computed once
+    def __init__(self, mztab, filename, slice, mgf, compression=None):
+        self.filename = filename
+        self.compression = compression
+        self.slice = slice
+        self.samples = mztab.samples
+        self.assays = mztab.assays
+
+        # group the samples and their assays by slice
+        self.sample_slices = mztab.samples.groupby(slice, sort=False).indices
+        self.assay_slices = mztab.assays.groupby(mztab.assays['sample_ref'].map(mztab.samples[slice]),
+                                                 sort=False).indices
+
+        # metadata lines parsed once, and the tables as text, formatted once for all slices
+        self.metadata = _Metadata(mztab.txt, mztab.lines)
+        self.tables = [_TableSlicer(df, nulls) for df, nulls in map(mztab._unmasked, ('sml', 'smf', 'sme'))
+                       if df is not None]
+        self.mgf = mgf
+
+    def write(self, s):
+        # writes the mzTab of the slice value s, returns (s, file name, seconds)
+        start = time.perf_counter()
+        # keep only the assays related to any of the samples, and renumber everything from 1
+        samples = self.samples.iloc[self.sample_slices[s]]
+        assays = self.assays.iloc[self.assay_slices[s]] if s in self.assay_slices else self.assays.iloc[:0]
+        ids = _renumber(samples, assays)
+        new_txt = self.metadata.lines(samples, assays, ids)
+
+        fname = self.filename.replace('.mzTab', '_' + self.slice + '__' + str(s) + '.mzTab')
+        with open_text(fname, 'w', self.compression) as f:
+            writer = _LineWriter(f)
+            writer.lines(new_txt)
+
+            # cut the columns of the slice assays out of the tables, and rename them
+            tags = {'abundance_' + old: 'abundance_' + new for old, new in ids.items() if old.startswith('assay[')}
+            for table in self.tables:
+                writer.line('')
+                table.write(writer, tags)
+
+            # add an empty line and the mgf
+            writer.line('')
+            if self.mgf is not None:
+                for block in self.mgf.blocks():
+                    writer.block(block)
+        return s, fname, time.perf_counter() - start
+
+
+def _updated(column, value):
+    # a copy of column set to value, a scalar for all rows or a mapping or Series for the rows of its index
+    if isinstance(value, dict):
+        value = pd.Series(value, dtype=object)
+    if isinstance(value, pd.Series):
+        value = value[value.index.isin(column.index)]
+        column = column.astype(object)
+        column.loc[value.index] = value.to_numpy()
+        return column
+    return pd.Series(value, index=column.index, dtype=object)
+
+
+def _description(description, values, sep):
+    # a sample description with the values of its keys replaced, keys without value removed and keys it did not
+    # have appended. The other tokens keep their place and text.
+    tokens = []
+    if isinstance(description, str):
+        for token in description.split(sep):
+            key = token.partition(':')[0]
+            if token != '' and key in values:
+                value = values.pop(key)
+                if pd.isna(value):
+                    continue
+                token = key + ':' + str(value)
+            tokens.append(token)
+    for key, value in values.items():
+        if not pd.isna(value):
+            tokens.append(key + ':' + str(value))
+    if len(tokens) == 0 and not isinstance(description, str):
+        return description
+    return sep.join(tokens)
+
+
+def _line_section(line):
+    # name of the self.lines entry a line of the file belongs to
+    if line.startswith('MTD\tsample['):
+        return 'samples'
+    elif line.startswith('MTD\tassay['):
+        return 'assays'
+    elif line.startswith('MTD\tms_run['):
+        return 'ms_runs'
+    elif line.startswith('SMH'):
+        return 'smh'
+    elif line.startswith('SML'):
+        return 'sml'
+    elif line.startswith('SFH'):
+        return 'sfh'
+    elif line.startswith('SMF'):
+        return 'smf'
+    elif line.startswith('SEH'):
+        return 'seh'
+    elif line.startswith('SME'):
+        return 'sme'
+    elif line.startswith('COM\tMGF'):
+        return 'mgf'
+    return 'rest'
+
+
+class _TableBuffer(object):
+    # collects the rows of a table section in blocks, so that only one block of raw lines is alive at any
+    # time. Blocks become object arrays of split rows, or typed DataFrames once the header columns are known.
+    def __init__(self, section, typed=False, block_size=10000):
+        self.section = section
+        self.typed = typed
+        self.block_size = block_size
+        self.columns = None
+        self.rows = []
+        self.blocks = []
+        self.nrows = 0
+
+    def append(self, line):
+        self.rows.append(line)
+        self.nrows += 1
+        if len(self.rows) >= self.block_size:
+            self.__flush()
+
+    def __flush(self):
+        if len(self.rows) == 0:
+            return
+        if self.typed:
+            if self.columns is None:
+                # wait for the header
+                return
+            self.blocks.append(_read_table('\n'.join(self.rows), self.section, self.columns))
+        else:
+            self.blocks.append(_object_array([row.split('\t') for row in self.rows]))
+        self.rows = []
+
+    def to_frame(self, columns):
+        self.columns = columns
+        self.__flush()
+        blocks, self.blocks = self.blocks, []
+        if self.typed:
+            if len(blocks) == 0:
+                return _read_table('', self.section, columns)
+            return pd.concat(blocks, ignore_index=True) if len(blocks) > 1 else blocks[0]
+
+        if len(blocks) == 0:
+            return pd.DataFrame([], columns=columns)
+        width = max(block.shape[1] for block in blocks)
+        values = np.concatenate([_pad_columns(block, width) for block in blocks]) if len(blocks) > 1 \
+            else blocks[0]
+        if width < len(columns):
+            # short rows are padded with None, as pd.DataFrame does for lists of lists
+            values = _pad_columns(values, len(columns))
+        return pd.DataFrame(values, columns=columns)
+
+
+def _object_array(rows):
+    # 2d object array of a list of split rows, short rows padded with None
+    width = max(len(row) for row in rows)
+    values = np.empty((len(rows), width), dtype=object)
+    if all(len(row) == width for row in rows):
+        values[:] = rows
+    else:
+        for i, row in enumerate(rows):
+            values[i, :len(row)] = row
+    return values
+
+
+def _pad_columns(values, width):
+    if values.shape[1] == width:
+        return values
+    padded = np.empty((values.shape[0], width), dtype=object)
+    padded[:, :values.shape[1]] = values
+    return padded
+
+
+# byte prefixes of the sections that are skipped as a whole by the lazy loader, and the patterns finding the
+# newline that ends a run of them
+RUN_PREFIXES = {'sml': b'SML', 'smf': b'SMF', 'sme': b'SME', 'mgf': b'COM\tMGF'}
+RUN_ENDS = {section: re.compile(b'\n(?!' + re.escape(prefix) + b')') for section, prefix in RUN_PREFIXES.items()}
+
+
+def _index_file(mm, txt, lines):
+    # byte ranges of every section of a memory map, as a dict of lists of [start, end]. Runs of table and mgf
+    # lines are skipped with a regex, all the other lines are decoded into txt and indexed in lines.
+    index = {section: [] for section in lines}
+    size = len(mm)
+    pos = 0
+    while pos < size:
+        end = mm.find(b'\n', pos)
+        end = size if end == -1 else end + 1
+        section = None
+        for name, prefix in RUN_PREFIXES.items():
+            if mm[pos:pos + len(prefix)] == prefix:
+                section = name
+                if end < size:
+                    match = RUN_ENDS[name].search(mm, end - 1)
+                    end = size if match is None else match.start() + 1
+                break
+        if section is None:
+            line = mm[pos:end].decode().rstrip('\n')
+            section = _line_section(line.rstrip('\r'))
+            lines[section].append(len(txt))
+            txt.append(line.rstrip('\r'))
+
+        runs = index[section]
+        if len(runs) > 0 and runs[-1][1] == pos:
+            runs[-1][1] = end
+        else:
+            runs.append([pos, end])
+        pos = end
+
+    # mimic f.read().split('\n'), which ends with an empty line if the file ends with a newline
+    if size == 0 or mm[size - 1:size] == b'\n':
+        lines['rest'].append(len(txt))
+        txt.append('')
+    return index
+
+
+class _LazySection(object):
+    # attribute of mzTab that is parsed from its byte ranges on first access after load(lazy=True)
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        if self.name in obj._pending:
+            obj._materialize(self.name)
+        if self.name in obj._masks:
+            obj._apply_mask(self.name)
+        value = obj.__dict__.get(self.name)
+        if self.name in TABLE_HEADERS and value is not None and obj._source is not None \
+                and self.name not in obj._changed and self.name not in obj._fingerprints:
+            # the table is handed out and may be edited in place: save(incremental=True) compares it to this
+            obj._fingerprints[self.name] = _fingerprint(value)
+        return value
+
+    def __set__(self, obj, value):
+        obj._pending.discard(self.name)
+        obj._masks.pop(self.name, None)
+        obj._changed.add(self.name)
+        obj.__dict__[self.name] = value
+        # a new table may have the id and length of the one indexed, e.g. a copy edited and set back
+        index = obj.__dict__.get('_index')
+        if index is not None:
+            index.clear()
+
 
 class mzTab(object):
+    samples = _LazySection('samples')
+    assays = _LazySection('assays')
+    sml = _LazySection('sml')
+    smf = _LazySection('smf')
+    sme = _LazySection('sme')
+    mgf = _LazySection('mgf')
+
     def __init__(self, file):
         self.file = file
         self.sep_desc = ' | '
         self.txt = None
         self.lines = {'samples': [], 'ms_runs': [], 'assays': [], 'smh': [], 'sml': [], 'sfh': [], 'smf': [], 'seh': [],'sme': [], 'mgf': [], 'rest': []}
+        # byte ranges of the sections after load(lazy=True), and the attributes that were not parsed yet
+        self.index = None
+        self._mmap = None
+        self._typed = False
+        self._pending = set()
+        # samples whose description does not match their key columns anymore
+        self._dirty = set()
+        # abundance_assay columns of every table deleted or nullified, and not applied to the table yet
+        self._masks = dict()
+        # size and mtime of self.file when it was loaded, and the attributes replaced or changed since then
+        self._source = None
+        self._changed = set()
+        # hashes of the tables handed out since the load, to find the ones edited in place
+        self._fingerprints = dict()
+        # PhaseStats of the operations since profile() was called, None if profiling is disabled
+        self.stats = None
+        self._profiler = None
+        # indexes of the SML, SMF and SME tables, built by the first query that needs them
+        self._index = FeatureIndex(self)
         self.samples = None
         self.assays = None
         self.sml = None
@@ -33,97 +829,414 @@ class mzTab(object):
         # Update the class reference of the instance
         setattr(self, "__class__", new)
 
-    def load(self):
+    def profile(self, callback=None, memory=False, enabled=True):
+        """
+        Times the phases of load(), save() and save_slices() from now on, e.g. the reading, the classification of
+        the lines and the parsing of every table and of the samples and assays in load(), or the metadata, every
+        table and the closing of the file in save(). Every phase is appended to self.stats as a PhaseStats of its
+        operation, name, wall time in seconds, bytes and rows, and passed to callback if given. The lazy tables
+        parsed on first access are timed as operation 'materialize'. With memory=True the peak of the python
+        allocations of every phase is measured with tracemalloc, at a cost in speed. profile(enabled=False)
+        turns profiling off and keeps self.stats, and the operations cost what they did before profiling.
+        """
+        if enabled:
+            self._profiler = Profiler(callback, memory)
+            self.stats = self._profiler.stats
+        else:
+            self._profiler = None
+        return self.stats
+
+    def _phase(self, operation, phase):
+        # a context that times a phase, doing nothing when profiling is off
+        return NO_PHASE if self._profiler is None else self._profiler.phase(operation, phase)
+
+    def load(self, stream=False, typed=False, lazy=False, cache=None):
+        """
+        Loads self.file. With stream=True the file is classified line by line while it is read: the SML, SMF and
+        SME rows go straight into per-section buffers and only the lines needed to write the file back are kept
+        in self.txt, so the peak memory stays close to the size of the final tables.
+        With typed=True the tables are parsed by the C reader of pandas with the mzTab-M column types: ids and
+        charges become Int64, masses, retention times and abundances float64, and null becomes a missing value.
+        With lazy=True the file is memory-mapped and only the metadata lines are read: self.index holds the byte
+        ranges of every section, and self.samples, self.assays, self.sml, self.smf and self.sme are parsed from
+        their ranges on first access. The file must not be modified while it is mapped.
+        Files compressed with gzip or zstd are decompressed as they are read, whatever their extension. They
+        can't be mapped, so lazy=True loads them like stream=True.
+        cache is a mzTabCache, or the directory of one: cached files are restored from it instead of being parsed,
+        and files parsed by a non-lazy load are added to it.
+        """
+        # size and mtime of the file before it is read, checked by save(incremental=True) before copying from it
+        stat = os.stat(self.file)
+        self.__load(stream, typed, lazy, cache)
+        self._source = (stat.st_size, stat.st_mtime_ns)
+        self._changed = set()
+        self._fingerprints = dict()
+
+    def __load(self, stream, typed, lazy, cache):
+        if cache is not None:
+            if not isinstance(cache, mzTabCache):
+                cache = mzTabCache(cache)
+            with self._phase('load', 'cache_restore'):
+                restored = cache.restore(self, typed)
+            if restored:
+                return
+            if not lazy:
+                self.__load(stream, typed, lazy, None)
+                with self._phase('load', 'cache_store'):
+                    cache.store(self, typed)
+                return
+
+        if lazy and detect(self.file) is None:
+            self.__load_lazy(typed)
+            return
+        if lazy:
+            # compressed files can't be mapped
+            stream = True
+        if stream:
+            self.__load_stream(typed)
+            return
+
         # load self.file as text
-        with open(self.file, 'r') as f:
-            txt = f.read()
-        self.txt = txt.split('\n')
-
-        for i, line in enumerate(self.txt):
-            # parse the header
-            if line.startswith('MTD\tsample'):
-                self.lines['samples'].append(i)
-            elif line.startswith('MTD\tassay'):
-                self.lines['assays'].append(i)
-            elif line.startswith('MTD\tms_run'):
-                self.lines['ms_runs'].append(i)
-            elif line.startswith('SMH'):
-                self.lines['smh'].append(i)
-            elif line.startswith('SML'):
-                self.lines['sml'].append(i)
-            elif line.startswith('SFH'):
-                self.lines['sfh'].append(i)
-            elif line.startswith('SMF'):
-                self.lines['smf'].append(i)
-            elif line.startswith('SEH'):
-                self.lines['seh'].append(i)
-            elif line.startswith('SME'):
-                self.lines['sme'].append(i)
-            elif line.startswith('COM\tMGF'):
-                self.lines['mgf'].append(i)
-            else:
-                self.lines['rest'].append(i)
+        with self._phase('load', 'read') as phase:
+            with open_text(self.file) as f:
+                txt = f.read()
+            phase.bytes = os.path.getsize(self.file)
+
+        with self._phase('load', 'classify') as phase:
+            self.txt = txt.split('\n')
+            # the lines hold the whole text from now on
+            del txt
+            for i, line in enumerate(self.txt):
+                self.lines[_line_section(line)].append(i)
+            phase.rows = len(self.txt)
+        with self._phase('load', 'mgf') as phase:
+            phase.rows = len(self.lines['mgf'])
+            self._collect_mgf()
 
         # pandalize SML
         # convert the sml lines to a pandas dataframe
-        sml = []
-        for i in self.lines['sml']:
-            sml.append(self.txt[i].split('\t'))
-        self.sml = pd.DataFrame(sml, columns=self.txt[self.lines['smh'][0]].split('\t'))
+        with self._phase('load', 'sml') as phase:
+            self.sml = self.__table('sml', 'smh', typed)
+            phase.rows = len(self.lines['sml'])
 
         # pandalize SMF
         # convert the smf lines to a pandas dataframe
         self.smf = None
         if len(self.lines['smf']) > 0:
-            smf = []
-            for i in self.lines['smf']:
-                smf.append(self.txt[i].split('\t'))
-            self.smf = pd.DataFrame(smf, columns=self.txt[self.lines['sfh'][0]].split('\t'))
+            with self._phase('load', 'smf') as phase:
+                self.smf = self.__table('smf', 'sfh', typed)
+                phase.rows = len(self.lines['smf'])
 
         # pandalize SME
         # convert the sme lines to a pandas dataframe
         self.sme = None
         if len(self.lines['sme']) > 0:
-            sme = []
-            for i in self.lines['sme']:
-                sme.append(self.txt[i].split('\t'))
-            self.sme = pd.DataFrame(sme, columns=self.txt[self.lines['seh'][0]].split('\t'))
+            with self._phase('load', 'sme') as phase:
+                self.sme = self.__table('sme', 'seh', typed)
+                phase.rows = len(self.lines['sme'])
 
         # samples table
-        self.__parse_samples()
-        self.__parse_assays()
+        self.__parse_metadata('load')
+
+    def __table(self, section, header, typed=False):
+        columns = self.txt[self.lines[header][0]].split('\t')
+        if typed:
+            return _read_table('\n'.join([self.txt[i] for i in self.lines[section]]), section, columns)
+        rows = []
+        for i in self.lines[section]:
+            rows.append(self.txt[i].split('\t'))
+        return pd.DataFrame(rows, columns=columns)
+
+    def __load_stream(self, typed=False):
+        # table rows are buffered per section, everything else is kept in self.txt
+        self.txt = []
+        buffers = {section: _TableBuffer(section, typed) for section in ('sml', 'smf', 'sme')}
+        headers = {'smh': 'sml', 'sfh': 'smf', 'seh': 'sme'}
+
+        # mgf lines are collected as one block of bytes instead of one string per line
+        mgf = bytearray()
+        line = '\n'
+        with self._phase('load', 'read') as phase, open_text(self.file) as f:
+            for line in f:
+                row = line[:-1] if line.endswith('\n') else line
+                section = _line_section(row)
+                if section in buffers:
+                    buffers[section].append(row)
+                    continue
+                if section == 'mgf':
+                    mgf += line.encode()
+                    continue
+                if section in headers and buffers[headers[section]].columns is None:
+                    buffers[headers[section]].columns = row.split('\t')
+                self.lines[section].append(len(self.txt))
+                self.txt.append(row)
+            phase.bytes = os.path.getsize(self.file)
+            phase.rows = len(self.txt) + sum(buffer.nrows for buffer in buffers.values())
+
+        # mimic f.read().split('\n'), which ends with an empty line if the file ends with a newline
+        if line.endswith('\n'):
+            self.lines['rest'].append(len(self.txt))
+            self.txt.append('')
+        with self._phase('load', 'mgf') as phase:
+            phase.bytes = len(mgf)
+            # the newlines were read as \n, the last one is dropped in place
+            if mgf.endswith(b'\n'):
+                del mgf[-1:]
+            self.mgf = MGFStore(mgf) if len(mgf) > 0 else None
+
+        # pandalize SML, SMF and SME from the buffers
+        self.sml = self.smf = self.sme = None
+        for section, header in (('sml', 'smh'), ('smf', 'sfh'), ('sme', 'seh')):
+            if section == 'sml' or buffers[section].nrows > 0:
+                with self._phase('load', section) as phase:
+                    phase.rows = buffers[section].nrows
+                    setattr(self, section, buffers[section].to_frame(self.txt[self.lines[header][0]].split('\t')))
 
-    def __parse_samples(self):
-        # iterate over lines in samples
-        samples = list()
-        for i in self.lines['samples']:
-            tokens = self.txt[i].split('\t') 
-            idx = tokens[1].split(']')[0]+']'
+        # samples table
+        self.__parse_metadata('load')
+
+    def __load_lazy(self, typed=False):
+        self.txt = []
+        self._typed = typed
+        with open(self.file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # empty files can't be mapped
+                self._mmap = b''
+            else:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with self._phase('load', 'index') as phase:
+            self.index = _index_file(self._mmap, self.txt, self.lines)
+            phase.bytes = len(self._mmap)
+            phase.rows = len(self.txt)
+
+        self._pending.update(['samples', 'assays', 'sml'])
+        if len(self.index['smf']) > 0:
+            self._pending.add('smf')
+        if len(self.index['sme']) > 0:
+            self._pending.add('sme')
+        if len(self.index['mgf']) > 0:
+            self._pending.add('mgf')
+
+    def _materialize(self, name):
+        with self._phase('materialize', name) as phase:
+            phase.bytes = sum(end - start for start, end in self.index.get(name, []))
+            self.__materialize(name)
+            if name in ('sml', 'smf', 'sme'):
+                phase.rows = len(self.__dict__[name])
+
+    def __materialize(self, name):
+        # parse a lazy attribute from the byte ranges in self.index
+        self._pending.discard(name)
+        if name == 'samples':
+            self.__parse_samples()
+        elif name == 'assays':
+            self.__parse_assays()
+        elif name == 'mgf':
+            # copied from the map range by range, without a bytes object per range
+            data = bytearray()
+            with memoryview(self._mmap) as view:
+                for start, end in self.index['mgf']:
+                    data += view[start:end]
+            self.__dict__['mgf'] = MGFStore.from_bytes(data)
+        else:
+            header = {'sml': 'smh', 'smf': 'sfh', 'sme': 'seh'}[name]
+            columns = self.txt[self.lines[header][0]].split('\t')
+            block = b''.join([self._mmap[start:end] for start, end in self.index[name]])
+            # set through __dict__, so that the masks recorded before the parsing are kept
+            if self._typed:
+                self.__dict__[name] = _read_table(block, name, columns)
+            else:
+                buffer = _TableBuffer(name)
+                for line in block.decode().split('\n'):
+                    if line != '':
+                        buffer.append(line.rstrip('\r'))
+                self.__dict__[name] = buffer.to_frame(columns)
+
+    def _unmap(self):
+        # parses the attributes still pending and closes the memory map of load(lazy=True), so that self.file
+        # can be overwritten
+        if self.index is None:
+            return
+        for name in list(self._pending):
+            self._materialize(name)
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._mmap = None
+        self.index = None
+
+    def _apply_mask(self, name):
+        # drops and nullifies the abundance_assay columns recorded by samples_delete and samples_nullify. Float
+        # columns are nullified with NaN and keep their dtype.
+        dropped, nulled = self._masks.pop(name)
+        df = self.__dict__.get(name)
+        if df is None:
+            return
+        self._changed.add(name)
+        drop = [col for col in df.columns if col in dropped]
+        if len(drop) > 0:
+            df.drop(columns=drop, inplace=True)
+        floats = [col for col in df.columns if col in nulled and df[col].dtype == np.float64]
+        if len(floats) > 0:
+            df[floats] = np.nan
+        others = [col for col in df.columns if col in nulled and df[col].dtype != np.float64]
+        if len(others) > 0:
+            df[others] = None
+
+    def _unmasked(self, name):
+        # a table as stored, without the pending deletes and nullifications, and the columns to write as null. The
+        # deleted columns are not written since their assays are not in self.assays anymore.
+        if name in self._pending:
+            self._materialize(name)
+        return self.__dict__.get(name), self._masks.get(name, ((), ()))[1]
+
+    def iter_sml(self, chunksize=10000, columns=None, typed=True):
+        """
+        Iterates over the SML rows of self.file in DataFrames of at most chunksize rows, parsed like
+        load(typed=True), or as text with typed=False. columns restricts the parsed columns, e.g. to SML_ID and a
+        few abundance_assay[n]. Only one chunk is in memory at a time, whatever the size of the file.
+        """
+        return self.__iter_table('sml', chunksize, columns, typed)
 
-            if tokens[1].endswith(']'):
-                # add a lank dict to the samples list
-                if len(samples) == 0:
-                    samples = [{'sample_id': idx, 'description': None}]
-                else:
-                    samples.append({'sample_id': idx, 'description': None})
-            elif tokens[1].endswith(']-description'):
-                # ceate a dictionary with the index, description and the line
-                sample = {'sample_id': idx, 'description': tokens[2]}
-                # try to split tokens[2] by self.sep_desc
-                desc_tokens = tokens[2].split(self.sep_desc)
-                # iterate over the description tokens, split by ":" and, if not empty, add to the dictionary
-                for token in desc_tokens:
-                    if token != '':
-                        key, value = token.split(':')
-                        sample[key] = value
-
-                if len(samples) == 0:
-                    samples = [sample]
-                else:
-                    samples.append(sample)
+    def iter_smf(self, chunksize=10000, columns=None, typed=True):
+        """
+        Iterates over the SMF rows of self.file in DataFrames of at most chunksize rows, see iter_sml.
+        """
+        return self.__iter_table('smf', chunksize, columns, typed)
 
+    def iter_sme(self, chunksize=10000, columns=None, typed=True):
+        """
+        Iterates over the SME rows of self.file in DataFrames of at most chunksize rows, see iter_sml.
+        """
+        return self.__iter_table('sme', chunksize, columns, typed)
+
+    def __iter_table(self, section, chunksize, columns, typed):
+        header = {'sml': 'smh', 'smf': 'sfh', 'sme': 'seh'}[section]
+        f = None
+        if self.index is None and detect(self.file) is not None:
+            # compressed files can't be mapped, their rows are collected as the file is decompressed
+            yield from self.__iter_compressed(section, header, chunksize, columns, typed)
+            return
+        if self.index is not None:
+            # the sections found by load(lazy=True)
+            mm, txt, lines, index = self._mmap, self.txt, self.lines, self.index
+        else:
+            f = open(self.file, 'rb')
+            txt, lines = [], {section: [] for section in self.lines}
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size > 0 else b''
+            index = _index_file(mm, txt, lines)
+
+        try:
+            if len(lines[header]) == 0:
+                return
+            names = txt[lines[header][0]].split('\t')
+            for block in _iter_lines(mm, index[section], chunksize):
+                yield _read_table(block, section, names, columns, typed)
+        finally:
+            if f is not None:
+                if isinstance(mm, mmap.mmap):
+                    mm.close()
+                f.close()
+
+    def __iter_compressed(self, section, header, chunksize, columns, typed):
+        names = None
+        rows = []
+        with open_text(self.file) as f:
+            for line in f:
+                kind = _line_section(line)
+                if kind == header and names is None:
+                    names = line.rstrip('\r\n').split('\t')
+                elif kind == section and names is not None:
+                    rows.append(line)
+                    if len(rows) == chunksize:
+                        yield _read_table(''.join(rows), section, names, columns, typed)
+                        rows = []
+        if len(rows) > 0:
+            yield _read_table(''.join(rows), section, names, columns, typed)
+
+    def features_in_window(self, mz, tol_ppm=10, rt_range=None):
+        """
+        The SMF rows whose exp_mass_to_charge is within tol_ppm of mz, and whose retention_time_in_seconds is in
+        rt_range, a (start, end) tuple in seconds, if given. mz can be None to query by retention time only, but not
+        without rt_range. The first query sorts the SMF table by m/z and retention time, the next ones are binary
+        searches, until the table is replaced or marked by mark_changed().
+        """
+        if self.smf is None:
+            return None
+        return self.smf.iloc[self._index.features_in_window(mz, tol_ppm, rt_range)]
+
+    def features_for(self, sml_id):
+        """
+        The SMF rows referenced by the SMF_ID_REFS of the SML rows with SML_ID sml_id, a single id or a list.
+        """
+        if self.smf is None:
+            return None
+        return self.smf.iloc[self._index.features_for(sml_id)]
+
+    def evidence_for(self, sml_id):
+        """
+        The SME rows referenced by the SME_ID_REFS of the features of the SML rows with SML_ID sml_id, following
+        SML -> SMF -> SME through hash indexes of the ids that are built by the first query.
+        """
+        if self.sme is None:
+            return None
+        return self.sme.iloc[self._index.evidence_for(sml_id)]
+
+    def _collect_mgf(self):
+        # moves the mgf lines of self.txt into a MGFStore, that holds them as one block of bytes. The lines are
+        # encoded a batch at a time and freed as soon as they are copied, so the text of the mgf is never held twice.
+        if len(self.lines['mgf']) == 0:
+            self.mgf = None
+            return
+        mgf = bytearray()
+        indexes = self.lines['mgf']
+        for k in range(0, len(indexes), MGF_BATCH):
+            batch = indexes[k:k + MGF_BATCH]
+            mgf += '\n'.join([self.txt[i] for i in batch]).encode()
+            mgf += b'\n'
+            for i in batch:
+                self.txt[i] = None
+        del mgf[-1:]
+        self.mgf = MGFStore(mgf)
+        self.lines['mgf'] = []
+
+    def _mgf_lines(self):
+        # mgf lines of the file
+        return [] if self.mgf is None else self.mgf.lines()
+
+    def __parse_metadata(self, operation):
+        with self._phase(operation, 'samples') as phase:
+            self.__parse_samples()
+            phase.rows = len(self.samples)
+        with self._phase(operation, 'assays') as phase:
+            self.__parse_assays()
+            phase.rows = len(self.assays)
+
+    def __parse_samples(self):
+        # one row per sample[n] line, without description, and one per sample[n]-description line
+        sample_ids, descriptions = [], []
+        for i in self.lines['samples']:
+            idx, prop, value = _parse_mtd(self.txt[i])
+            if prop == '':
+                sample_ids.append(idx)
+                descriptions.append(None)
+            elif prop == '-description':
+                sample_ids.append(idx)
+                descriptions.append(value)
+        df = pd.DataFrame({'sample_id': sample_ids, 'description': descriptions})
+
+        # split the descriptions into key:value tokens, at the first colon so that values may hold colons, and
+        # turn the keys into columns. If a key is repeated in a description the last value is kept. Descriptions
+        # are optional, there may be none to split.
+        if df['description'].notna().any():
+            tokens = df['description'].str.split(self.sep_desc, regex=False).explode()
+            tokens = tokens[tokens.notna() & (tokens != '')]
+            if len(tokens) > 0:
+                parts = tokens.str.partition(':')
+                pairs = pd.DataFrame({'row': tokens.index, 'key': parts[0].to_numpy(), 'value': parts[2].to_numpy()})
+                pairs = pairs.drop_duplicates(subset=['row', 'key'], keep='last')
+                keys = pairs.pivot(index='row', columns='key', values='value')
+                df = df.join(keys[pd.unique(pairs['key'])])
 
-        df = pd.DataFrame(samples)
         # sort by description
         df.sort_values('description', inplace=True)
         # remove duplicates, keep the last
@@ -132,6 +1245,7 @@ class mzTab(object):
         df.set_index('sample_id', inplace=True)
 
         self.samples = df
+        self._dirty = set()
 
     def __parse_assays(self):
         # iterate over lines in ms_runs
@@ -168,331 +1282,585 @@ class mzTab(object):
         self.assays = pd.DataFrame.from_dict(assays,orient='index')
 
     def samples_update(self, key, value):
-        # updates any column in samples named key with value
+        """
+        Updates the column key of samples, and of assays if it has one, with value: a scalar for every row, or a
+        mapping or a Series of values by sample_id (by assay id for assays) for the rows it holds. The
+        descriptions of the samples that changed are rewritten from their columns when the file is saved.
+        """
         if key in self.samples.columns:
-            # in self.samples.description, replace key:value with NEW value
-            for i in self.samples.index:
-                self.samples.at[i, 'description'] = self.samples.loc[i].description.replace(
-                    key + ':' + self.samples.loc[i][key], key + ':' + value)
-            self.samples[key] = value
+            old = self.samples[key]
+            new = _updated(old, value)
+            if key != 'description':
+                changed = (old != new) & ~(old.isna() & new.isna())
+                self._dirty.update(self.samples.index[changed.to_numpy()])
+            self.samples[key] = new
 
         if key in self.assays.columns:
-            self.assays[key] = value
+            self.assays[key] = _updated(self.assays[key], value)
+
+    def _sync_descriptions(self):
+        # rewrites the descriptions of the samples updated since the load from their key columns
+        if len(self._dirty) == 0:
+            return
+        keys = [col for col in self.samples.columns if col != 'description']
+        rows = self.samples.index.isin(list(self._dirty))
+        self.samples.loc[rows, 'description'] = [
+            _description(description, dict(zip(keys, values)), self.sep_desc)
+            for description, values in zip(self.samples.loc[rows, 'description'],
+                                           self.samples.loc[rows, keys].itertuples(index=False, name=None))]
+        self._dirty = set()
 
     def samples_nullify(self, key, values):
+        """
+        Nullifies the abundances of the assays of the samples whose key is one of values. The columns are only
+        recorded: they are set to null when sml or smf is next accessed, and written as null by save() without
+        touching the tables, so repeated calls cost the number of assays they touch.
+        """
         # find all samples that are associated to the values
         if key in self.samples.columns:
-            sample_ids = self.samples[self.samples[key].isin(values)].index
+            sample_ids = self.samples.index[self.samples[key].isin(values)]
             # find assays that are associated to the samples
-            assays = self.assays[self.assays['sample_ref'].isin(sample_ids)].index
-            # transform assays to a list of strings
-            assays = ['abundance_' + str(i) for i in assays]
-            # find all columns in sml that are associated to the assays
-            sml_cols = self.sml.columns
-            sml_cols = [col for col in sml_cols if col in assays]
-            # set all columns to None
-            self.sml[sml_cols] = None
-            # find all columns in smf that are associated to the assays
-            if self.smf is not None:
-                smf_cols = self.smf.columns
-                smf_cols = [col for col in smf_cols if col in assays]
-                # set all columns to None
-                self.smf[smf_cols] = None
-                print("Nullified assays:", assays)
+            assays = self.assays.index[self.assays['sample_ref'].isin(sample_ids)]
+            tags = ['abundance_' + str(i) for i in assays]
+            self.__mask_assays(tags, drop=False)
+            print("Nullified assays:", tags)
 
     def samples_delete(self, key, values):
+        """
+        Deletes the samples whose key is one of values, and their assays. Like in samples_nullify, the abundance
+        columns of the assays are dropped from sml and smf when the tables are next accessed.
+        """
         # find all samples that are associated to the values
         if key in self.samples.columns:
-            sample_ids = self.samples[self.samples[key].isin(values)].index
+            sample_ids = self.samples.index[self.samples[key].isin(values)]
             # find assays that are associated to the samples
-            assays = self.assays[self.assays['sample_ref'].isin(sample_ids)].index
-            # transform assays to a list of strings
-            assays_tags = ['abundance_' + str(i) for i in assays]
-            # remove ms_runs that don't exist in the assays
-            ms_run_refs = self.assays['ms_run_ref'].unique()
-            ms_run_refs = [ms_run for ms_run in ms_run_refs if ms_run not in self.assays.index]
-
-
-            # find all columns in sml that are associated to the assays_tags
-            sml_cols = self.sml.columns
-            sml_cols = [col for col in sml_cols if col in assays_tags]
-            # delete all columns
-            self.sml.drop(columns=sml_cols, inplace=True)
-            # find all columns in smf that are associated to the assays
-            if self.smf is not None:
-                smf_cols = self.smf.columns
-                smf_cols = [col for col in smf_cols if col in assays]
-                # set all columns to None
-                self.smf.drop(columns=smf_cols, inplace=True)
+            assays = self.assays.index[self.assays['sample_ref'].isin(sample_ids)]
+            self.__mask_assays(['abundance_' + str(i) for i in assays], drop=True)
             # remove the samples from the samples table
             self.samples.drop(index=sample_ids, inplace=True)
             # remove assays from the assays table
             self.assays.drop(index=assays, inplace=True)
             print("Deleted samples:", sample_ids)
 
-    def save(self, filename):
-        # export a full mtTab. If self.txt is not None, it uses it as the template
-        new_txt = [self.txt[i] for i in self.lines['rest']]
-
-        # create a new column in self.samples with the new_id, an integer from 1 to n
-        self.samples['new_id'] = range(1, len(self.samples) + 1)
-
-        # create samples lines
-        new_samples = ['']
-        # cycle through the samples df
-        old_sample_lines = [self.txt[i] for i in self.lines['samples']]
-        for sample in self.samples.iterrows():
-            # find all lines in old_sample_lines that start with MTD\t{sample.sample_id}
-            sample_lines = [line for line in old_sample_lines if line.startswith('MTD\t' + sample[0])]
-            new_id = 'sample[' + str(sample[1]['new_id']) + ']'
-            for line in sample_lines:
-                # if line includs '-description', replace the description with the new description
-                if '-description' in line:
-                    line = 'MTD\t' + new_id + '-description\t' + sample[1]['description']
-                else:
-                    line = line.replace(sample[0], new_id)
-
-                new_samples.append(line)
-
-        new_txt.extend(new_samples)
-
-        # create ms_run lines
-        new_ms_runs = ['']
-        #ms_run_id_to_keep = self.assays['ms_run_ref'].unique()
-        ms_run_id_to_keep = self.assays['ms_run_ref'].unique().tolist()
-        # generate new ms_run ids from 1 to n
-        ms_run_id_new_idx = ['ms_run[' + str(i) + ']' for i in range(1, len(ms_run_id_to_keep) + 1)]
-
-        old_lines = [self.txt[i] for i in self.lines['ms_runs']]
-        for ms_run in ms_run_id_to_keep:
-            ms_run_lines = [line for line in old_lines if line.startswith('MTD\t' + ms_run)]
-            for line in ms_run_lines:
-                line = line.replace(ms_run, ms_run_id_new_idx[ms_run_id_to_keep.index(ms_run)])
-                new_ms_runs.append(line)
-
-        new_txt.extend(new_ms_runs)
-
-        # create assay lines
-        new_assays = ['']
-        # create a new column in self.samples with the new_id, an integer from 1 to n
-        self.assays['new_id'] = range(1, len(self.assays) + 1)
-
-        old_lines = [self.txt[i] for i in self.lines['assays']]
-        for assay in self.assays.iterrows():
-            assay_lines = [line for line in old_lines if line.startswith('MTD\t' + assay[0])]
-            for line in assay_lines:
-                line = line.replace(assay[0], 'assay[' + str(assay[1]['new_id']) + ']')
-                line = line.replace(assay[1]['ms_run_ref'], ms_run_id_new_idx[ms_run_id_to_keep.index(assay[1]['ms_run_ref'])])
-                line = line.replace(assay[1]['sample_ref'], 'sample[' + str(self.samples.loc[assay[1]['sample_ref']]['new_id']) + ']')
-                new_assays.append(line)
-
-        new_txt.extend(new_assays)
-
-        # create a two lists for the conversin of assay tags to new assay tags
-        assay_tags = self.sml.columns
-        assay_tags = [tag for tag in assay_tags if tag.startswith('abundance_assay[')]
-        # note: the ___ is introduced to avoid replacing the same tag multiple times
-        new_assay_tags = ['abundance___assay[' + str(i) + ']' for i in self.assays['new_id']]
-
-        # create sml lines
-        new_sml = []
-        header = self.txt[self.lines['smh'][0]]
-        # replace the old assay tags with the new assay tags
-        for i in range(len(assay_tags)):
-            header = header.replace(assay_tags[i], new_assay_tags[i])
-
-        header = header.replace('___','_')
-
-        new_sml.append(header)
-        for i in self.sml.iterrows():
-            line = i[1].values
-            line = [str(val) for val in line]
-            new_sml.append('\t'.join(line))
-
-        # replace None with null
-        new_sml = ['\t'.join([val if val != 'None' else 'null' for val in line.split('\t')]) for line in new_sml]
-
-        new_txt.extend(new_sml)
-
-        # create smf lines
-        if self.smf is not None:
-            new_smf = []
-            header = self.txt[self.lines['sfh'][0]]
-            # replace the old assay tags with the new assay tags
-            for i in range(len(assay_tags)):
-                header = header.replace(assay_tags[i], new_assay_tags[i])
-            header = header.replace('___','_')
-            new_smf.append(header)
-            for i in self.smf.iterrows():
-                line = i[1].values
-                line = [str(val) for val in line]
-                new_smf.append('\t'.join(line))
-
-            # replace None with null
-            new_smf = ['\t'.join([val if val != 'None' else 'null' for val in line.split('\t')]) for line in new_smf]
-            new_txt.extend(new_smf)
-
-        # create sme lines
-        if self.sme is not None:
-            new_sme = ['']
-            new_sme.append(self.txt[self.lines['seh'][0]])
-
-            for i in self.sme.iterrows():
-                line = i[1].values
-                line = [str(val) for val in line]
-                new_sme.append('\t'.join(line))
-            # replace None with null
-            new_sme = ['\t'.join([val if val != 'None' else 'null' for val in line.split('\t')]) for line in new_sme]
-            new_txt.extend(new_sme)
-
-        # add empty line
-        new_txt.append('')
-
-        # add mgf
-        new_txt.extend([self.txt[i] for i in self.lines['mgf']])
+    def __mask_assays(self, tags, drop):
+        # record the abundance columns to drop or nullify in every table with abundances
+        for name in ('sml', 'smf'):
+            dropped, nulled = self._masks.setdefault(name, (set(), set()))
+            if drop:
+                dropped.update(tags)
+                nulled.difference_update(tags)
+            else:
+                nulled.update(tags)
 
-        # remove consecutive empty lines
-        new_txt = [line for i, line in enumerate(new_txt) if i == 0 or line != '' or new_txt[i-1] != '']
+    def save(self, filename, incremental=False, compression=None):
+        """
+        Exports a full mzTab, using self.txt as the template. With incremental=True the SML, SMF and SME tables and
+        the MGF lines that did not change since the load are copied from the bytes of self.file, in the kernel
+        where the system allows it, and only the metadata and the changed sections are written from the tables.
+        A table changed if it was replaced, if some of its assays were deleted, nullified or renumbered, if it
+        was marked by mark_changed(), or if it was edited in place: the tables accessed since the load are hashed
+        on first access and hashed again here. Copied sections keep the text of self.file, such as the format of numbers
+        that a typed load would write differently.
+        The file is compressed with compression, 'gzip' or 'zstd', or if None as told by the extension of filename,
+        .gz or .zst, on all the cpus.
+        """
+        if _same_file(filename, self.file):
+            # the sections still mapped would be read from a truncated file
+            self._unmap()
+        with self._phase('save', 'metadata') as phase:
+            self._sync_descriptions()
+            # old -> new ids of the samples, ms_runs and assays, and the metadata lines renumbered through them
+            ids = _renumber(self.samples, self.assays)
+            new_txt = _Metadata(self.txt, self.lines).lines(self.samples, self.assays, ids)
+            phase.rows = len(new_txt)
+
+        # new tags of the abundance columns of the assays
+        tags = {'abundance_' + old: 'abundance_' + new for old, new in ids.items() if old.startswith('assay[')}
+
+        # opened before filename is truncated, to find out whether it is the file being saved
+        with _SourceFile(self, filename if incremental else None) as source, \
+                open_text(filename, 'w', compression) as f:
+            writer = _LineWriter(f)
+            writer.lines(new_txt)
+
+            # create sml lines
+            with self._phase('save', 'sml') as phase:
+                start = writer.size
+                if source.clean('sml', tags):
+                    source.copy(writer, 'sml')
+                else:
+                    sml, nulls = self._unmasked('sml')
+                    _write_table(writer, sml, nulls, tags)
+                    phase.rows = len(sml)
+                phase.bytes = writer.size - start
+
+            # create smf lines
+            with self._phase('save', 'smf') as phase:
+                start = writer.size
+                if source.clean('smf', tags):
+                    source.copy(writer, 'smf')
+                else:
+                    smf, nulls = self._unmasked('smf')
+                    if smf is not None:
+                        _write_table(writer, smf, nulls, tags)
+                        phase.rows = len(smf)
+                phase.bytes = writer.size - start
+
+            # create sme lines
+            with self._phase('save', 'sme') as phase:
+                start = writer.size
+                if source.clean('sme', tags):
+                    writer.line('')
+                    source.copy(writer, 'sme')
+                elif self.sme is not None:
+                    writer.line('')
+                    _write_table(writer, self.sme, (), tags)
+                    phase.rows = len(self.sme)
+                phase.bytes = writer.size - start
+
+            # add empty line
+            writer.line('')
 
-        with open(filename, 'w') as f:
-            f.write('\n'.join(new_txt))
+            # add mgf
+            with self._phase('save', 'mgf') as phase:
+                start = writer.size
+                if source.clean('mgf'):
+                    source.copy(writer, 'mgf')
+                elif self.mgf is not None:
+                    for block in self.mgf.blocks():
+                        writer.block(block)
+                phase.bytes = writer.size - start
+
+            # the data still buffered, or still being compressed, is written when the file is closed
+            with self._phase('save', 'close'):
+                f.close()
+
+    def export_dataset(self, directory, partition='patientid', layout='long'):
+        """
+        Writes samples, assays, SML, SMF and SME as a Parquet dataset in directory, to be queried with
+        read_dataset(), or any Arrow or Parquet reader, without parsing the mzTab again. The abundance_assay columns
+        of SML and SMF are written apart, in sml_abundance and smf_abundance, partitioned in hive style by the
+        partition column of the samples of their assays, e.g. patientid=P1/, or in one file if partition is None.
+        In the long layout every non null abundance is a row of the id, assay_id, sample_id and abundance, in the
+        wide layout every partition holds the id and the abundance_assay columns of its assays. The other columns
+        are typed like in load(typed=True) whatever the load, with null as a missing value.
+        """
+        if partition is not None and partition not in self.samples.columns:
+            print("Partition not found in samples")
+            return
+        self._sync_descriptions()
+        tables = dict()
+        for name in ('sml', 'smf', 'sme'):
+            df, nulls = self._unmasked(name)
+            if df is not None:
+                tables[name] = _dataset_table(df, name, nulls, self.assays.index)
+        write_dataset(directory, self.samples, self.assays, tables, partition, layout)
+
+    def mark_changed(self, *names):
+        """
+        Marks tables edited in place since the load, e.g. 'sml' after m.sml.loc[...] = ..., so that
+        save(incremental=True) writes them from the tables without hashing them, and the indexes of the queries
+        are built again. Replacing a table, or deleting or nullifying assays, marks it by itself, and save() finds
+        the other edits in place from the hashes of the tables.
+        """
+        self._changed.update(names)
+        self._index.clear()
 
-    def save_slices(self, filename = None, slice = "patientid"):
+    def save_slices(self, filename = None, slice = "patientid", workers = None, executor = 'process', progress = None,
+                    compression = None):
+        """
+        Divides the samples by the values of the slice column and exports a mzTab for each value. The assays of
+        every slice and the renaming of their columns are computed once, and the tables are converted to text
+        once, so that writing a slice only joins the columns it keeps.
+        With workers > 1 the slices are written by a pool of workers: executor is 'process' (forked processes that
+        inherit the tables instead of receiving them pickled, threads where fork is not available), 'thread', or a
+        concurrent.futures.Executor to submit the slices to. A ProcessPoolExecutor is refused: its workers would
+        have to receive the tables pickled with every slice, use executor='process' with workers instead. The files
+        are the same as in serial mode.
+        progress is called with (slice value, file name, seconds) every time a slice is written.
+        Every slice is compressed like in save(), e.g. filename 'study.mzTab.gz' writes 'study_patientid__P1.mzTab.gz'.
+        """
+        global _SLICE_WRITER
+        if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+            # its workers may be started already, or spawned, and would not inherit _SLICE_WRITER
+            raise ValueError("save_slices can't share its tables with the workers of a ProcessPoolExecutor, use "
+                             "executor='process' with workers, or a thread executor")
         if filename is None:
             filename = self.file
         # divide samples by slice, and then export a mzTab for each slice
         if slice not in self.samples.columns:
             print("Slice not found in samples")
             return
-        slices = self.samples[slice].unique()
-
-        for s in slices:
-            new_txt = [self.txt[i] for i in self.lines['rest']]
-
-            # create a copy
-            samples = self.samples[self.samples[slice] == s].copy()
-            samples['new_id'] = range(1, len(samples) + 1)
-
-            # create samples lines
-            new_samples = ['']
-            # cycle through the samples df
-            old_sample_lines = [self.txt[i] for i in self.lines['samples']]
-            for sample in samples.iterrows():
-                # find all lines in old_sample_lines that start with MTD\t{sample.sample_id}
-                sample_lines = [line for line in old_sample_lines if line.startswith('MTD\t' + sample[0])]
-                new_id = 'sample[' + str(sample[1]['new_id']) + ']'
-                for line in sample_lines:
-                    # if line includs '-description', replace the description with the new description
-                    if '-description' in line:
-                        line = 'MTD\t' + new_id + '-description\t' + sample[1]['description']
-                    else:
-                        line = line.replace(sample[0], new_id)
-                    new_samples.append(line)
-            new_txt.extend(new_samples)
-
-            # filter assays to keep only those related to any of the samples
-            assays = self.assays[self.assays['sample_ref'].isin(samples.index)].copy()
-            # create a new column in self.samples with the new_id, an integer from 1 to n
-            assays['new_id'] = range(1, len(assays) + 1)
-            # add a column name old_tag to the assays
-            assays['old_tag'] = ['abundance_' + str(i) for i in assays.index]
-            # add a column named new_tag to the assays
-            assays['new_tag'] = ['abundance___assay[' + str(i) + ']' for i in assays['new_id']]
-
-            # create ms_run lines
-            new_ms_runs = ['']
-            ms_run_id_to_keep = assays['ms_run_ref'].unique().tolist()
-            # generate new ms_run ids from 1 to n
-            ms_run_id_new_idx = ['ms_run[' + str(i) + ']' for i in range(1, len(ms_run_id_to_keep) + 1)]
-
-            old_lines = [self.txt[i] for i in self.lines['ms_runs']]
-            for ms_run in ms_run_id_to_keep:
-                ms_run_lines = [line for line in old_lines if line.startswith('MTD\t' + ms_run)]
-                for line in ms_run_lines:
-                    line = line.replace(ms_run, ms_run_id_new_idx[ms_run_id_to_keep.index(ms_run)])
-                    new_ms_runs.append(line)
-
-            new_txt.extend(new_ms_runs)
-
-            # create assay lines
-            new_assays = ['']
-            old_lines = [self.txt[i] for i in self.lines['assays']]
-            for assay in assays.iterrows():
-                assay_lines = [line for line in old_lines if line.startswith('MTD\t' + assay[0])]
-                for line in assay_lines:
-                    line = line.replace(assay[0], 'assay[' + str(assay[1]['new_id']) + ']')
-                    line = line.replace(assay[1]['ms_run_ref'],
-                                        ms_run_id_new_idx[ms_run_id_to_keep.index(assay[1]['ms_run_ref'])])
-                    line = line.replace(assay[1]['sample_ref'],
-                                        'sample[' + str(samples.loc[assay[1]['sample_ref']]['new_id']) + ']')
-                    new_assays.append(line)
-
-            new_txt.extend(new_assays)
-
-            # create a copy of self.sml
-            sml = self.sml.copy()
-            # find columns of sml that start with abundance_ass
-            abcols = [col for col in sml.columns if col.startswith('abundance_ass')]
-            # remove those that are listed in assays['old_tag']
-            cols_to_delete = [i for i in abcols if i not in assays['old_tag']]
-            sml.drop(columns=cols_to_delete, inplace=True)
-            sml.columns = [assays['new_tag'][assays['old_tag'].tolist().index(col)] if col in assays['old_tag'].tolist() else col for col in sml.columns]
-
-            # convert to a list of strings,use \t as separator, include the header
-            new_sml = ['']
-            new_sml.append('\t'.join(sml.columns).replace('___','_'))
-            for i in sml.iterrows():
-                line = i[1].values
-                line = [str(val) for val in line]
-                new_sml.append('\t'.join(line))
-
-            # replace None with null
-            new_sml = ['\t'.join([val if val != 'None' else 'null' for val in line.split('\t')]) for line in new_sml]
-            new_txt.extend(new_sml)
-
-            # create a copy of self.smf, remove all columns that are not in the assays
-            if self.smf is not None:
-                smf = self.smf.copy()
-                smf.drop(columns=cols_to_delete, inplace=True)
-                smf.columns = [assays['new_tag'][assays['old_tag'].tolist().index(col)] if col in assays[
-                    'old_tag'].tolist() else col for col in smf.columns]
-
-                # convert to a list of strings,use \t as separator, include the header
-                new_smf = ['']
-                new_smf.append('\t'.join(smf.columns).replace('___','_'))
-                for i in smf.iterrows():
-                    line = i[1].values
-                    line = [str(val) for val in line]
-                    new_smf.append('\t'.join(line))
-                # replace None with null
-                new_smf = ['\t'.join([val if val != 'None' else 'null' for val in line.split('\t')]) for line in new_smf]
-                new_txt.extend(new_smf)
-
-            # create a copy of self.sme, remove all columns that are not in the assays
-            if self.sme is not None:
-                sme = self.sme.copy()
-                new_sme = ['']
-                new_sme.append('\t'.join(sme.columns))
-                for i in sme.iterrows():
-                    line = i[1].values
-                    line = [str(val) for val in line]
-                    new_sme.append('\t'.join(line))
-                # replace None with null
-                new_sme = ['\t'.join([val if val != 'None' else 'null' for val in line.split('\t')]) for line in new_sme]
-                new_txt.extend(new_sme)
-
-            # add an empty line
-            new_txt.append('')
-
-            # add mgf
-            new_txt.extend([self.txt[i] for i in self.lines['mgf']])
 
-            # remove consecutive empty lines
-            new_txt = [line for i, line in enumerate(new_txt) if i == 0 or line != '' or new_txt[i - 1] != '']
+        with self._phase('save_slices', 'prepare'):
+            self._sync_descriptions()
+            writer = _SliceWriter(self, filename, slice, self.mgf, compression)
+            slices = self.samples[slice].dropna().unique()
+
+        def done(s, fname, seconds):
+            # the slices are timed by the workers that write them
+            if self._profiler is not None:
+                self._profiler.add('save_slices', 'slice ' + str(s), seconds, os.path.getsize(fname))
+            if progress is not None:
+                progress(s, fname, seconds)
+
+        if isinstance(executor, concurrent.futures.Executor):
+            pool = None
+            futures = [executor.submit(writer.write, s) for s in slices]
+        elif workers is not None and workers > 1:
+            _SLICE_WRITER = writer
+            if executor == 'process' and 'fork' in multiprocessing.get_all_start_methods():
+                pool = concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+                futures = [pool.submit(_write_slice, s) for s in slices]
+            else:
+                pool = concurrent.futures.ThreadPoolExecutor(workers)
+                futures = [pool.submit(writer.write, s) for s in slices]
+        else:
+            for s in slices:
+                done(*writer.write(s))
+            return
 
-            fname = filename.replace('.mzTab', '_' + slice + '__' + s + '.mzTab')
-            with open(fname, 'w') as f:
-                f.write('\n'.join(new_txt))
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                done(*future.result())
+        finally:
+            if pool is not None:
+                pool.shutdown()
+                _SLICE_WRITER = None
+
+
+# outcome of load_many for one file: the loaded mzTab or None, the seconds spent and the traceback of the error
+LoadResult = namedtuple('LoadResult', ['file', 'mztab', 'seconds', 'error'])
+
+
+def _to_ipc(df):
+    table = pyarrow.Table.from_pandas(df, preserve_index=False)
+    sink = pyarrow.BufferOutputStream()
+    with ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _from_ipc(data):
+    return ipc.open_stream(pyarrow.py_buffer(data)).read_all().to_pandas(split_blocks=True, self_destruct=True)
+
+
+def _load_file(file, kwargs, send=False):
+    # loads a file for load_many. With send=True the result goes back to another process: only the passthrough
+    # lines are kept, the tables travel as Arrow IPC streams, that are far cheaper to pickle than object columns,
+    # and the mgf lines as one block of bytes
+    start = time.perf_counter()
+    try:
+        m = mzTab(file)
+        m.load(**kwargs)
+        if send:
+            meta, frames, mgf = pack(m)
+            if pyarrow is not None:
+                frames = {name: _to_ipc(df) for name, df in frames.items()}
+            m = (meta, frames, mgf)
+        return m, time.perf_counter() - start, None
+    except Exception:
+        return None, time.perf_counter() - start, traceback.format_exc()
+
+
+def load_many(files, workers=None, executor='process', progress=None, **kwargs):
+    """
+    Loads many mzTab files in parallel and returns a list of LoadResult(file, mztab, seconds, error) in the order
+    of files. A file that fails to load has mztab None and the traceback in error, the other files still load.
+    kwargs are passed to load(), e.g. typed=True or cache, except lazy that would keep every file mapped.
+    executor is 'process' (a pool of workers sending the tables back as Arrow IPC streams when pyarrow is
+    installed), 'thread', or a concurrent.futures.Executor; workers defaults to the number of CPUs and 1 loads
+    the files one after the other. progress is called with (file, seconds, error) every time a file is loaded.
+    A worker process that dies, e.g. killed for lack of memory, breaks its pool: the files not loaded yet get
+    the BrokenProcessPool traceback in error.
+    """
+    kwargs.pop('lazy', None)
+    files = list(files)
+    workers = os.cpu_count() if workers is None else workers
+    results = [None] * len(files)
+
+    def done(i, loaded, seconds, error):
+        if error is None and not isinstance(loaded, mzTab):
+            # rebuild the mzTab sent back by a worker process
+            start = time.perf_counter()
+            meta, frames, mgf = loaded
+            loaded = mzTab(files[i])
+            try:
+                unpack(loaded, meta, lambda name: _from_ipc(frames[name]) if pyarrow is not None else frames[name],
+                       mgf)
+            except Exception:
+                loaded, error = None, traceback.format_exc()
+            seconds += time.perf_counter() - start
+        results[i] = LoadResult(files[i], loaded, seconds, error)
+        if progress is not None:
+            progress(files[i], seconds, error)
+
+    if isinstance(executor, concurrent.futures.Executor):
+        pool = None
+        send = isinstance(executor, concurrent.futures.ProcessPoolExecutor)
+    elif workers > 1 and len(files) > 1:
+        send = executor == 'process'
+        if send:
+            pool = concurrent.futures.ProcessPoolExecutor(min(workers, len(files)))
+        else:
+            pool = concurrent.futures.ThreadPoolExecutor(min(workers, len(files)))
+        executor = pool
+    else:
+        for i, file in enumerate(files):
+            done(i, *_load_file(file, kwargs))
+        return results
+
+    try:
+        start = time.perf_counter()
+        futures = {executor.submit(_load_file, file, kwargs, send): i for i, file in enumerate(files)}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                result = future.result()
+            except Exception:
+                # the worker died, e.g. killed for lack of memory, and broke the pool: the files it had not
+                # loaded yet fail with it, those already loaded are kept
+                result = None, time.perf_counter() - start, traceback.format_exc()
+            done(futures[future], *result)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return results
+
+
+# id column of every table, and the column that references the ids of another table
+TABLE_IDS = {'sml': ('SML_ID', 'SMF_ID_REFS', 'smf'), 'smf': ('SMF_ID', 'SME_ID_REFS', 'sme'), 'sme': ('SME_ID', None, None)}
+TABLE_HEADERS = {'sml': 'smh', 'smf': 'sfh', 'sme': 'seh'}
+MS_RUN_ID = re.compile(r'ms_run\[\d+\]')
+
+
+def _offset_ids(cells, offset):
+    # ids, or | separated lists of ids, of a text column shifted by offset
+    if offset == 0:
+        return cells
+    return [cell if cell == 'null' else
+            '|'.join(str(int(i) + offset) if i.strip().isdigit() else i for i in cell.split('|')) for cell in cells]
+
+
+def _spectra_ref(cell, ids):
+    # the | separated spectra of a spectra_ref cell with their ms_run renumbered through ids. The spectra of the
+    # ms_runs that are not written, since no assay refers to them anymore, are dropped.
+    if cell == 'null' or MS_RUN_ID.search(cell) is None:
+        return cell
+    spectra = []
+    for spectrum in cell.split('|'):
+        found = MS_RUN_ID.search(spectrum)
+        if found is None:
+            spectra.append(spectrum)
+        elif found.group() in ids:
+            spectra.append(MS_RUN_ID.sub(lambda m: ids.get(m.group(), m.group()), spectrum))
+    return '|'.join(spectra) if len(spectra) > 0 else 'null'
+
+
+class _MergeSource(object):
+    # one input of merge: its metadata and tables, the new ids of its entities and the offsets of its table ids
+    def __init__(self, source):
+        if not isinstance(source, mzTab):
+            source = mzTab(source)
+            source.load(lazy=True)
+        source._sync_descriptions()
+        self.mztab = source
+        self.metadata = _Metadata(source.txt, source.lines)
+        self.samples = source.samples
+        self.assays = source.assays
+        # the ms_runs of the assays, like save() writes them: those of deleted assays are dropped
+        self.ms_runs = list(self.assays['ms_run_ref'].unique())
+        self.ids = dict()
+        self.tags = dict()
+        self.offsets = dict()
+
+    def columns(self, name):
+        # header of a table, None if the input has no such table
+        if name not in self.mztab._pending:
+            df = self.mztab._unmasked(name)[0]
+            return None if df is None else list(df.columns)
+        header = self.mztab.lines[TABLE_HEADERS[name]]
+        return self.mztab.txt[header[0]].split('\t') if len(header) > 0 else None
+
+    def chunks(self, name, chunksize, columns):
+        # the table a chunk at a time, streamed from the file if it was not parsed
+        if name in self.mztab._pending:
+            yield from getattr(self.mztab, 'iter_' + name)(chunksize, columns, typed=False)
+            return
+        df = self.mztab._unmasked(name)[0][columns]
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+    def nulls(self, name):
+        # abundance columns nullified by samples_nullify and not applied to the table yet
+        return self.mztab._masks.get(name, ((), ()))[1]
+
+    def max_id(self, name):
+        col = TABLE_IDS[name][0]
+        columns = self.columns(name)
+        if columns is None or col not in columns:
+            return 0
+        max_id = 0
+        for chunk in self.chunks(name, 100000, [col]):
+            value = pd.to_numeric(chunk[col], errors='coerce').max()
+            if value == value:
+                max_id = max(max_id, int(value))
+        return max_id
+
+    def mgf_lines(self):
+        # mgf lines, with the FEATURE_ID of the spectra shifted like the SMF ids
+        offset = self.offsets['smf']
+        for line in self.mztab._mgf_lines():
+            if offset != 0 and line.startswith('COM\tMGF\tFEATURE_ID='):
+                key, value = line.split('=', 1)
+                line = key + '=' + _offset_ids([value], offset)[0]
+            yield line
+
+
+def _merge_rest(sources):
+    # the rest lines of the first input, then the MTD lines of the other inputs with a name not seen yet. The
+    # references of the _ref and _refs lines found in several inputs are joined.
+    lines, seen, refs = [], dict(), dict()
+    for k, source in enumerate(sources):
+        for line in source.metadata.rest_lines(source.ids):
+            tokens = line.split('\t', 2)
+            if tokens[0] != 'MTD' or len(tokens) < 3:
+                if k == 0:
+                    lines.append(line)
+                continue
+            key = tokens[1]
+            if key not in seen:
+                seen[key] = len(lines)
+                lines.append(line)
+            if key.endswith('_ref') or key.endswith('_refs'):
+                refs.setdefault(key, []).append(tokens[2])
+    for key, values in refs.items():
+        if len(values) > 1:
+            joined = dict.fromkeys(ref.strip() for value in values for ref in value.split('|') if ref.strip() != 'null')
+            lines[seen[key]] = 'MTD\t' + key + '\t' + ('|'.join(joined) if len(joined) > 0 else 'null')
+    return lines
+
+
+def _merge_table(writer, sources, name, chunksize):
+    # writes the header and the rows of a table of all inputs. The header holds the columns of the inputs in order
+    # of appearance, with the renamed abundance_assay columns of all inputs in one block where the first appears.
+    headers = [source.columns(name) for source in sources]
+    if all(header is None for header in headers):
+        return
+    names, assays, anchor = [], [], None
+    renames = []
+    for source, header in zip(sources, headers):
+        rename = dict()
+        previous = None
+        for col in header or []:
+            if col.startswith('abundance_assay['):
+                if col not in source.tags:
+                    continue
+                if anchor is None:
+                    anchor = names.index(previous) + 1 if previous is not None else 0
+                rename[col] = source.tags[col]
+                assays.append(rename[col])
+            else:
+                if col not in names:
+                    names.append(col)
+                rename[col] = col
+                previous = col
+        renames.append(rename)
+    if anchor is not None:
+        names[anchor:anchor] = assays
+    writer.line('\t'.join(names))
+
+    id_col, ref_col, ref_table = TABLE_IDS[name]
+    # rows of many inputs are mostly null cells, the text written at once is bounded by the width of the table
+    step = max(100, CHUNK_CELLS // len(names))
+    for source, header, rename in zip(sources, headers, renames):
+        if header is None:
+            continue
+        # nullified columns are written like the columns the input does not have
+        nulls = source.nulls(name)
+        original = {new: col for col, new in rename.items() if col not in nulls}
+        plan = [original.get(col) for col in names]
+        for chunk in source.chunks(name, chunksize, list(original.values())):
+            if len(chunk) == 0:
+                continue
+            text = dict(zip(chunk.columns, _format_frame(chunk)))
+            if id_col in text:
+                text[id_col] = _offset_ids(text[id_col], source.offsets[name])
+            if ref_col in text:
+                text[ref_col] = _offset_ids(text[ref_col], source.offsets[ref_table])
+            if 'spectra_ref' in text:
+                text['spectra_ref'] = [_spectra_ref(cell, source.ids) for cell in text['spectra_ref']]
+            # columns the input does not have are null, joined once per run of them
+            pieces = []
+            for col, run in itertools.groupby(plan, key=lambda col: col is None):
+                if col:
+                    pieces.append(itertools.repeat('\t'.join(['null'] * len(list(run)))))
+                else:
+                    pieces.extend(text[original_col] for original_col in run)
+            rows = zip(*pieces)
+            for start in range(0, len(chunk), step):
+                writer.block('\n'.join(map('\t'.join, itertools.islice(rows, step))))
+
+
+def merge(sources, filename, chunksize=10000):
+    """
+    Merges mzTab files, or loaded mzTab objects, into one study written to filename. The samples, ms_runs and
+    assays of every input are numbered after those of the previous inputs and the abundance_assay columns are
+    renamed accordingly, in one block of columns; the SML, SMF and SME rows are appended one input after the
+    other, with their ids, their id references and the FEATURE_ID of the MGF spectra shifted past the largest ids
+    of the previous inputs. The other metadata comes from the first input that has it, and the references of the
+    _ref and _refs lines, e.g. study_variable[1]-assay_refs, are joined over all inputs.
+    Like in save(), only the ms_runs of the assays are written. The spectra_ref of the SME rows are renumbered
+    with them, and their spectra of the ms_runs not written are dropped, whereas save() keeps spectra_ref as is.
+    Files are opened with load(lazy=True) and their rows are streamed to filename chunksize rows at a time, so that
+    the text of the inputs is never held in memory. Objects are written with their current tables. filename is
+    compressed if its extension is .gz or .zst.
+    """
+    sources = [_MergeSource(source) for source in sources]
+    if len(sources) == 0:
+        raise ValueError('Nothing to merge')
+    for source in sources:
+        if _same_file(filename, source.mztab.file):
+            source.mztab._unmap()
+
+    # new ids of the samples, ms_runs and assays, numbered after those of the previous inputs
+    counts = {'sample': 0, 'ms_run': 0, 'assay': 0}
+    for source in sources:
+        for prefix, entity_ids in (('sample', source.samples.index), ('ms_run', source.ms_runs),
+                                   ('assay', source.assays.index)):
+            for entity_id in entity_ids:
+                counts[prefix] += 1
+                source.ids[entity_id] = prefix + '[' + str(counts[prefix]) + ']'
+        source.tags = {'abundance_' + old: 'abundance_' + new for old, new in source.ids.items()
+                       if old.startswith('assay[')}
+
+    # offsets of the table ids of every input
+    offsets = {name: 0 for name in TABLE_IDS}
+    for source in sources:
+        source.offsets = dict(offsets)
+        for name in TABLE_IDS:
+            offsets[name] += source.max_id(name)
+
+    with open_text(filename, 'w') as f:
+        writer = _LineWriter(f)
+        writer.lines(_merge_rest(sources))
+        writer.line('')
+        for source in sources:
+            writer.lines(source.metadata.entity_lines(source.samples.index, source.ids, source.samples['description']))
+        writer.line('')
+        for source in sources:
+            writer.lines(source.metadata.entity_lines(source.ms_runs, source.ids))
+        writer.line('')
+        for source in sources:
+            writer.lines(source.metadata.entity_lines(source.assays.index, source.ids))
+
+        _merge_table(writer, sources, 'sml', chunksize)
+        _merge_table(writer, sources, 'smf', chunksize)
+        if any(source.columns('sme') is not None for source in sources):
+            writer.line('')
+            _merge_table(writer, sources, 'sme', chunksize)
+        writer.line('')
+        for source in sources:
+            writer.lines(source.mgf_lines())
 
 if __name__ == "__main__":
     # print version
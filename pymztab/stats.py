@@ -0,0 +1,92 @@
+import time
+import tracemalloc
+from collections import namedtuple
+
+# one timed phase of an operation of mzTab. bytes and rows are what the phase read, parsed or wrote, None when
+# they do not apply, and peak_memory is the peak of the python allocations of the phase, with memory=True only.
+PhaseStats = namedtuple('PhaseStats', ['operation', 'phase', 'seconds', 'bytes', 'rows', 'peak_memory'])
+
+
+class _NoPhase(object):
+    # stands for every phase when profiling is disabled, entering it and setting its bytes and rows do nothing
+    __slots__ = ('bytes', 'rows')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NO_PHASE = _NoPhase()
+
+
+class _Phase(object):
+    def __init__(self, profiler, operation, phase):
+        self.profiler = profiler
+        self.operation = operation
+        self.phase = phase
+        self.bytes = None
+        self.rows = None
+        self.peak = 0
+
+    def __enter__(self):
+        self.profiler.enter(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        seconds = time.perf_counter() - self.start
+        self.profiler.exit(self, seconds)
+        return False
+
+
+class Profiler(object):
+    """
+    Records the phases of the operations of a mzTab as PhaseStats in the list stats, and calls callback with each
+    of them as it ends. With memory=True the peak memory of every phase is measured by tracemalloc, which slows
+    the operations down. Phases may run inside other phases, e.g. the parsing of a lazy table during save().
+    """
+    def __init__(self, callback=None, memory=False):
+        self.stats = []
+        self.callback = callback
+        self.memory = memory
+        self.stack = []
+        self.tracing = False
+
+    def phase(self, operation, phase):
+        return _Phase(self, operation, phase)
+
+    def enter(self, phase):
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            # the peak so far belongs to the enclosing phase, before it is reset for this one
+            if len(self.stack) > 0:
+                self.stack[-1].peak = max(self.stack[-1].peak, peak - self.stack[-1].base)
+            phase.base = current
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        self.stack.append(phase)
+
+    def exit(self, phase, seconds):
+        self.stack.pop()
+        peak = None
+        if self.memory:
+            peak = max(phase.peak, tracemalloc.get_traced_memory()[1] - phase.base)
+            if len(self.stack) > 0:
+                parent = self.stack[-1]
+                parent.peak = max(parent.peak, peak + phase.base - parent.base)
+            elif self.tracing:
+                tracemalloc.stop()
+                self.tracing = False
+        self.add(phase.operation, phase.phase, seconds, phase.bytes, phase.rows, peak)
+
+    def add(self, operation, phase, seconds, bytes=None, rows=None, peak_memory=None):
+        # records a phase timed elsewhere, e.g. by a worker process
+        stats = PhaseStats(operation, phase, seconds, bytes, rows, peak_memory)
+        self.stats.append(stats)
+        if self.callback is not None:
+            self.callback(stats)
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from generate import generate
+from pymztab.mztab import mzTab
+
+
+@pytest.fixture(scope='session')
+def small_file(tmp_path_factory):
+    # a synthetic mzTab-M file with 6 samples of 3 patients, 6 assays, SML, SMF, SME and MGF sections
+    path = str(tmp_path_factory.mktemp('data') / 'small.mzTab')
+    generate(path, samples=6, sml=40, mgf=5, peaks=4)
+    return path
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def loaded(path, **kwargs):
+    # a mzTab of path, loaded with kwargs
+    m = mzTab(str(path))
+    m.load(**kwargs)
+    return m
+
+
+def saved(m, path, **kwargs):
+    # the bytes of m saved to path with kwargs
+    m.save(str(path), **kwargs)
+    return read_bytes(str(path))
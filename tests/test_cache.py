@@ -0,0 +1,78 @@
+import json
+import multiprocessing
+import os
+import shutil
+
+import pytest
+
+from conftest import loaded, read_bytes, saved
+from pymztab import cache as cache_module
+from pymztab.cache import MGF_FILE, mzTabCache
+from pymztab.mztab import load_many
+
+
+def test_cache_stores_mgf_bytes(small_file, tmp_path):
+    cache = mzTabCache(str(tmp_path / 'cache'))
+    parsed = loaded(small_file, cache=cache)
+    restored = loaded(small_file, cache=cache)
+
+    entry = cache.entries()[0][0]
+    with open(os.path.join(entry, 'meta.json')) as f:
+        meta = json.load(f)
+    assert not any(line.startswith('COM\tMGF') for line in meta['txt'])
+    assert read_bytes(os.path.join(entry, MGF_FILE)) == parsed.mgf.raw
+    assert restored.mgf.raw == parsed.mgf.raw
+    assert saved(restored, tmp_path / 'restored.mzTab') == saved(parsed, tmp_path / 'parsed.mzTab')
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_load_many_sends_mgf_bytes(small_file, tmp_path):
+    expected = loaded(small_file)
+    result, = load_many([small_file], workers=2, executor='process')
+    assert result.error is None
+    assert result.mztab.mgf.raw == expected.mgf.raw
+    assert saved(result.mztab, tmp_path / 'sent.mzTab') == saved(expected, tmp_path / 'loaded.mzTab')
+
+
+def test_store_loses_the_rename_race(small_file, tmp_path, monkeypatch):
+    cache = mzTabCache(str(tmp_path / 'cache'))
+    loaded(small_file, cache=cache)
+    entry = cache.entries()[0][0]
+    shutil.copytree(entry, str(tmp_path / 'other'))
+    rename = os.rename
+
+    def racing_rename(src, dst):
+        # another process stores the same file between the rmtree and the rename
+        shutil.copytree(str(tmp_path / 'other'), dst)
+        rename(src, dst)
+
+    monkeypatch.setattr(cache_module.os, 'rename', racing_rename)
+    assert cache.store(loaded(small_file), False)
+    assert len(loaded(small_file, cache=cache).sml) == 40
+    assert [name for name in os.listdir(str(tmp_path / 'cache')) if name.startswith('.')] == []
+
+
+def test_entry_evicted_while_restored(small_file, tmp_path, monkeypatch):
+    cache = mzTabCache(str(tmp_path / 'cache'))
+    expected = saved(loaded(small_file, cache=cache), tmp_path / 'parsed.mzTab')
+    read_frame = cache_module._read_frame
+
+    def evicted(path, format):
+        cache.clear()
+        return read_frame(path, format)
+
+    monkeypatch.setattr(cache_module, '_read_frame', evicted)
+    m = loaded(small_file, cache=cache)
+    assert saved(m, tmp_path / 'restored.mzTab') == expected
+
+
+def test_store_fails(small_file, tmp_path, monkeypatch):
+    cache = mzTabCache(str(tmp_path / 'cache'))
+
+    def full(*args, **kwargs):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(cache_module, '_write_frame', full)
+    expected = saved(loaded(small_file), tmp_path / 'parsed.mzTab')
+    assert saved(loaded(small_file, cache=cache), tmp_path / 'out.mzTab') == expected
+    assert os.listdir(str(tmp_path / 'cache')) == []
@@ -0,0 +1,57 @@
+import gzip
+import os
+
+import pytest
+
+from conftest import loaded, read_bytes, saved
+from pymztab import compression
+
+MODES = [dict(), dict(stream=True), dict(lazy=True), dict(typed=True)]
+
+
+@pytest.mark.parametrize('extension,name', [('.gz', 'gzip'), ('.zst', 'zstd')])
+def test_compressed_round_trip(small_file, tmp_path, extension, name):
+    if name == 'zstd':
+        pytest.importorskip('zstandard')
+    path = str(tmp_path / ('out.mzTab' + extension))
+    loaded(small_file).save(path)
+    assert compression.detect(path) == name
+    for kwargs in MODES:
+        expected = saved(loaded(small_file, **kwargs), tmp_path / 'expected.mzTab')
+        assert saved(loaded(path, **kwargs), tmp_path / 'plain.mzTab') == expected
+
+
+def test_compression_is_found_from_the_content(small_file, tmp_path):
+    # compression='gzip' wins over the extension, and reading looks at the first bytes only
+    path = str(tmp_path / 'out.mzTab')
+    loaded(small_file).save(path, compression='gzip')
+    assert compression.detect(path) == 'gzip'
+    assert saved(loaded(path), tmp_path / 'plain.mzTab') == saved(loaded(small_file), tmp_path / 'expected.mzTab')
+
+
+def test_gzip_members_on_threads(small_file, tmp_path, monkeypatch):
+    # a file of many members compressed in parallel reads back as one, with the gzip module too
+    monkeypatch.setattr(compression, 'BLOCK_SIZE', 4096)
+    path = str(tmp_path / 'out.mzTab.gz')
+    with compression.open_text(path, 'w', threads=3) as f:
+        f.write(read_bytes(small_file).decode())
+    assert read_bytes(path).count(compression.MAGIC['gzip'] + b'\x08') >= len(read_bytes(small_file)) // 4096
+    with gzip.open(path, 'rb') as f:
+        assert f.read() == read_bytes(small_file)
+
+
+def test_incremental_save_of_a_compressed_source(small_file, tmp_path):
+    # a compressed source can't be copied from, every section is written from the tables
+    path = str(tmp_path / 'source.mzTab.gz')
+    loaded(small_file).save(path)
+    m = loaded(path)
+    assert saved(m, tmp_path / 'incremental.mzTab', incremental=True) == saved(m, tmp_path / 'full.mzTab')
+
+
+def test_compressed_slices(small_file, tmp_path):
+    loaded(small_file).save_slices(str(tmp_path / 'out.mzTab.gz'))
+    names = sorted(os.listdir(str(tmp_path)))
+    assert names == ['out_patientid__P1.mzTab.gz', 'out_patientid__P2.mzTab.gz', 'out_patientid__P3.mzTab.gz']
+    for name in names:
+        assert compression.detect(str(tmp_path / name)) == 'gzip'
+        assert len(loaded(tmp_path / name).samples) == 2
@@ -0,0 +1,39 @@
+import pytest
+
+from conftest import loaded
+from pymztab.mztab import read_dataset
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.mark.parametrize('layout', ['long', 'wide'])
+def test_export_after_nullify(small_file, tmp_path, layout):
+    m = loaded(small_file)
+    m.samples_nullify('patientid', ['P1'])
+    m.export_dataset(str(tmp_path), 'patientid', layout)
+    df = read_dataset(str(tmp_path), 'sml_abundance')
+    assert len(df) > 0
+    p1 = read_dataset(str(tmp_path), 'sml_abundance', filters=[('patientid', '=', 'P1')])
+    if layout == 'long':
+        assert len(p1) == 0
+        assert set(df['patientid']) == {'P2', 'P3'}
+    else:
+        assert p1.drop(columns='SML_ID').isna().all().all()
+
+
+def test_long_layout_values(small_file, tmp_path):
+    typed = loaded(small_file, typed=True)
+    loaded(small_file).export_dataset(str(tmp_path), 'patientid', 'long')
+    df = read_dataset(str(tmp_path), 'smf_abundance', filters=[('patientid', '=', 'P2')])
+    assert set(df['patientid']) == {'P2'}
+    for row in df.itertuples(index=False):
+        value = typed.smf.loc[typed.smf['SMF_ID'] == row.SMF_ID, 'abundance_' + row.assay_id].iloc[0]
+        assert value == row.abundance
+    assert list(read_dataset(str(tmp_path), 'sml').columns)[0] == 'SML_ID'
+
+
+def test_star_import():
+    namespace = {}
+    exec('from pymztab.mztab import *', namespace)
+    assert namespace['read_dataset'] is read_dataset
+    assert 'write_dataset' not in namespace
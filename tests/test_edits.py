@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from conftest import loaded, saved
+
+MODES = {'plain': {}, 'stream': {'stream': True}, 'lazy': {'lazy': True}}
+EDITS = {
+    'delete': lambda m: m.samples_delete('patientid', ['P1']),
+    'nullify': lambda m: m.samples_nullify('patientid', ['P2']),
+    'update': lambda m: m.samples_update('key1', 'changed'),
+}
+
+
+@pytest.mark.parametrize('edit', list(EDITS))
+def test_edits_in_every_load_mode(small_file, tmp_path, edit):
+    outputs = dict()
+    for mode, kwargs in MODES.items():
+        m = loaded(small_file, **kwargs)
+        EDITS[edit](m)
+        outputs[mode] = saved(m, tmp_path / (mode + '.mzTab'))
+    assert outputs['stream'] == outputs['plain']
+    assert outputs['lazy'] == outputs['plain']
+
+    m = loaded(tmp_path / 'plain.mzTab')
+    if edit == 'delete':
+        assert 'P1' not in set(m.samples['patientid'])
+        assert len(m.assays) == 4
+        assert not any(col.endswith('[5]') or col.endswith('[6]') for col in m.sml.columns)
+    elif edit == 'nullify':
+        assays = m.assays.index[m.assays['sample_ref'].map(m.samples['patientid']) == 'P2']
+        for name in ('sml', 'smf'):
+            table = getattr(m, name)
+            assert (table[['abundance_' + a for a in assays]] == 'null').all().all()
+    else:
+        assert set(m.samples['key1']) == {'changed'}
+
+
+def _assays(m, patient):
+    return ['abundance_' + a for a in m.assays.index[m.assays['sample_ref'].map(m.samples['patientid']) == patient]]
+
+
+def test_edits_are_applied_on_access(small_file):
+    m = loaded(small_file, typed=True)
+    nulled, deleted = _assays(m, 'P2'), _assays(m, 'P1')
+    m.samples_nullify('patientid', ['P2'])
+    m.samples_delete('patientid', ['P1'])
+    # only recorded, the tables are untouched until they are accessed
+    table = m.__dict__['sml']
+    assert set(deleted) <= set(table.columns)
+    assert table[nulled].notna().any().any()
+    assert m.sml is table
+    assert not set(deleted) & set(m.sml.columns)
+    assert m.sml[nulled].isna().all().all()
+    assert m.sml[nulled].dtypes.eq(np.float64).all()
+
+
+def test_nullify_then_delete_in_save(small_file, tmp_path):
+    # the columns recorded but never applied are written like the applied ones
+    m = loaded(small_file)
+    m.samples_nullify('patientid', ['P2'])
+    m.samples_delete('patientid', ['P1'])
+    expected = loaded(small_file)
+    expected.samples_nullify('patientid', ['P2'])
+    expected.samples_delete('patientid', ['P1'])
+    # accessing the tables applies the columns
+    expected.sml
+    expected.smf
+    assert expected._masks == dict()
+    assert saved(m, tmp_path / 'recorded.mzTab') == saved(expected, tmp_path / 'applied.mzTab')
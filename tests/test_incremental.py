@@ -0,0 +1,44 @@
+import pytest
+
+from conftest import loaded, saved
+
+EDITS = {
+    'none': lambda m: None,
+    'delete': lambda m: m.samples_delete('patientid', ['P1']),
+    'nullify': lambda m: m.samples_nullify('patientid', ['P2']),
+    'update': lambda m: m.samples_update('key1', 'changed'),
+}
+
+
+@pytest.mark.parametrize('edit', list(EDITS))
+def test_incremental_save_equals_full_save(small_file, tmp_path, edit):
+    outputs = dict()
+    for incremental in (False, True):
+        m = loaded(small_file)
+        EDITS[edit](m)
+        outputs[incremental] = saved(m, tmp_path / ('%s.mzTab' % incremental), incremental=incremental)
+    assert outputs[True] == outputs[False]
+
+
+@pytest.mark.parametrize('kwargs', [dict(), dict(lazy=True), dict(typed=True)])
+def test_edit_in_place_is_written(small_file, tmp_path, kwargs):
+    m = loaded(small_file, **kwargs)
+    m.sml.loc[0, 'chemical_name'] = 'EDITED'
+    m.smf.loc[1, 'adduct_ion'] = '[M+Na]1+'
+    expected = saved(m, tmp_path / 'full.mzTab')
+    assert saved(m, tmp_path / 'incremental.mzTab', incremental=True) == expected
+    out = loaded(tmp_path / 'incremental.mzTab')
+    assert out.sml.loc[0, 'chemical_name'] == 'EDITED'
+    assert out.smf.loc[1, 'adduct_ion'] == '[M+Na]1+'
+
+
+def test_tables_only_read_are_copied(small_file, tmp_path):
+    m = loaded(small_file, typed=True)
+    m.sml['SML_ID'].max()
+    m.smf.loc[0, 'charge'] = 2
+    stats = m.profile()
+    m.save(str(tmp_path / 'incremental.mzTab'), incremental=True)
+    # the rows of a section are only counted when it is written from its table
+    rows = {s.phase: s.rows for s in stats if s.operation == 'save'}
+    assert rows['sml'] is None
+    assert rows['smf'] == len(m.smf)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from conftest import loaded
+
+
+@pytest.fixture
+def typed(small_file):
+    return loaded(small_file, typed=True)
+
+
+def _expected(smf, mz, tol_ppm):
+    tol = mz * tol_ppm * 1e-6
+    values = smf['exp_mass_to_charge'].astype(float)
+    return smf.index[(values >= mz - tol) & (values <= mz + tol)].tolist()
+
+
+def test_window_needs_mz_or_rt(typed):
+    with pytest.raises(ValueError):
+        typed.features_in_window(None)
+
+
+def test_window_by_rt_only(typed):
+    rt = typed.smf['retention_time_in_seconds'].astype(float)
+    low, high = np.nanpercentile(rt, [25, 75])
+    found = typed.features_in_window(None, rt_range=(low, high))
+    assert found.index.tolist() == typed.smf.index[(rt >= low) & (rt <= high)].tolist()
+
+
+def test_mark_changed_rebuilds_indexes(typed):
+    mz = float(typed.smf['exp_mass_to_charge'].iloc[0])
+    assert 0 in typed.features_in_window(mz).index
+    # an edit in place keeps the table and its length
+    typed.smf.loc[0, 'exp_mass_to_charge'] = mz + 100
+    typed.mark_changed('smf')
+    assert typed.features_in_window(mz).index.tolist() == _expected(typed.smf, mz, 10)
+    assert 0 in typed.features_in_window(mz + 100).index
+
+
+def test_setting_a_table_rebuilds_indexes(typed):
+    mz = float(typed.smf['exp_mass_to_charge'].iloc[0])
+    typed.features_in_window(mz)
+    smf = typed.smf
+    smf.loc[0, 'exp_mass_to_charge'] = mz + 100
+    typed.smf = smf
+    assert 0 not in typed.features_in_window(mz).index
@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+from conftest import loaded, read_bytes
+from pymztab.mztab import mzTab
+
+TABLES = ['sml', 'smf', 'sme']
+
+
+def _iterated(path, name, **kwargs):
+    chunks = list(getattr(mzTab(str(path)), 'iter_' + name)(**kwargs))
+    return chunks, pd.concat(chunks, ignore_index=True)
+
+
+@pytest.mark.parametrize('chunksize', [1, 7, 40, 1000])
+@pytest.mark.parametrize('name', TABLES)
+def test_chunks_equal_the_typed_load(small_file, name, chunksize):
+    full = getattr(loaded(small_file, typed=True), name)
+    chunks, df = _iterated(small_file, name, chunksize=chunksize)
+    assert [len(chunk) for chunk in chunks[:-1]] == [chunksize] * (len(chunks) - 1)
+    assert 0 < len(chunks[-1]) <= chunksize
+    pd.testing.assert_frame_equal(df, full)
+
+
+def test_columns(small_file):
+    full = loaded(small_file, typed=True).sml
+    columns = ['SML_ID', 'abundance_assay[2]']
+    chunks, df = _iterated(small_file, 'sml', chunksize=15, columns=columns)
+    assert list(df.columns) == columns
+    pd.testing.assert_frame_equal(df, full[columns])
+    with pytest.raises(KeyError):
+        list(mzTab(small_file).iter_smf(columns=['SMF_ID', 'unknown']))
+
+
+@pytest.mark.parametrize('name', TABLES)
+def test_untyped(small_file, name):
+    full = getattr(loaded(small_file), name)
+    chunks, df = _iterated(small_file, name, chunksize=9, typed=False)
+    pd.testing.assert_frame_equal(df, full)
+
+
+def test_rows_interleaved_with_other_lines(small_file, tmp_path):
+    # comments between the rows, and the SML rows split in two runs around the SMF table
+    lines = read_bytes(small_file).decode().split('\n')
+    sml = [line for line in lines if line.startswith('SML\t')]
+    others = [line for line in lines if not line.startswith('SML\t')]
+    at = next(i for i, line in enumerate(others) if line.startswith('SFH'))
+    rows = []
+    for i, line in enumerate(sml[:20]):
+        rows += [line, 'COM\tcomment %d' % i] if i % 3 == 0 else [line]
+    others[at:at] = rows
+    end = max(i for i, line in enumerate(others) if line.startswith('SMF\t')) + 1
+    others[end:end] = sml[20:]
+    path = tmp_path / 'interleaved.mzTab'
+    path.write_text('\n'.join(others))
+
+    full = loaded(path, typed=True)
+    assert len(full.sml) == 40
+    for chunksize in (4, 40):
+        for name in TABLES:
+            pd.testing.assert_frame_equal(_iterated(path, name, chunksize=chunksize)[1], getattr(full, name))
+
+
+@pytest.mark.parametrize('kwargs', [dict(), dict(typed=False), dict(columns=['SML_ID'])])
+def test_gzip_input(small_file, tmp_path, kwargs):
+    path = tmp_path / 'in.mzTab.gz'
+    loaded(small_file).save(str(path))
+    expected = _iterated(small_file, 'sml', chunksize=11, **kwargs)
+    chunks, df = _iterated(path, 'sml', chunksize=11, **kwargs)
+    assert [len(chunk) for chunk in chunks] == [len(chunk) for chunk in expected[0]]
+    pd.testing.assert_frame_equal(df, expected[1])
+
+
+def test_iter_of_a_lazy_load(small_file):
+    m = loaded(small_file, lazy=True)
+    df = pd.concat(m.iter_smf(chunksize=6), ignore_index=True)
+    pd.testing.assert_frame_equal(df, loaded(small_file, typed=True).smf)
+    # iterating parses nothing
+    assert 'smf' in m._pending
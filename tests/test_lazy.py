@@ -0,0 +1,53 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+from conftest import loaded, read_bytes, saved
+from pymztab.mztab import merge
+
+
+def test_lazy_save_over_source(small_file, tmp_path):
+    expected = saved(loaded(small_file), tmp_path / 'expected.mzTab')
+    for typed in (False, True):
+        path = str(tmp_path / 'copy.mzTab')
+        shutil.copy(small_file, path)
+        m = loaded(path, lazy=True, typed=typed)
+        m.samples
+        m.save(path)
+        if not typed:
+            assert read_bytes(path) == expected
+        # the object is still usable after its map was closed
+        assert len(m.sml) == 40
+        assert len(list(m.iter_smf(chunksize=7))) == 6
+
+
+def test_merge_over_lazy_input(small_file, tmp_path):
+    path = str(tmp_path / 'copy.mzTab')
+    shutil.copy(small_file, path)
+    merge([small_file, small_file], str(tmp_path / 'expected.mzTab'))
+    merge([path, small_file], path)
+    assert read_bytes(path) == read_bytes(str(tmp_path / 'expected.mzTab'))
+
+
+@pytest.mark.parametrize('typed', [False, True])
+def test_lazy_equals_full_load(small_file, tmp_path, typed):
+    full = loaded(small_file, typed=typed)
+    m = loaded(small_file, lazy=True, typed=typed)
+    for name in ('samples', 'assays', 'sml', 'smf', 'sme'):
+        pd.testing.assert_frame_equal(getattr(m, name), getattr(full, name), obj=name)
+    assert bytes(m.mgf.raw) == bytes(full.mgf.raw)
+    expected = saved(full, tmp_path / 'full.mzTab')
+    assert saved(loaded(small_file, lazy=True, typed=typed), tmp_path / 'lazy.mzTab') == expected
+
+
+def test_lazy_load_parses_on_first_access(small_file):
+    m = loaded(small_file, lazy=True)
+    assert m._pending == {'samples', 'assays', 'sml', 'smf', 'sme', 'mgf'}
+    with open(small_file, 'rb') as f:
+        data = f.read()
+    # the byte ranges of every section hold its rows
+    for start, end in m.index['sml']:
+        assert all(line.startswith(b'SML\t') for line in data[start:end].splitlines())
+    assert len(m.smf) == 40
+    assert m._pending == {'samples', 'assays', 'sml', 'sme', 'mgf'}
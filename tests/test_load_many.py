@@ -0,0 +1,54 @@
+import multiprocessing
+import os
+
+import pytest
+
+from conftest import loaded, saved
+from pymztab import mztab
+from pymztab.mztab import load_many
+
+fork = pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+load_file = mztab._load_file
+
+
+def _files(small_file, tmp_path):
+    bad = str(tmp_path / 'bad.mzTab')
+    with open(bad, 'w') as f:
+        f.write('MTD\tmzTab-version\t2.0.0-M\nMTD\tassay[1]-sample_ref\tsample[1]\n')
+    return [small_file, bad, str(tmp_path / 'missing.mzTab'), small_file]
+
+
+@pytest.mark.parametrize('kwargs', [dict(workers=1), dict(workers=2, executor='thread'),
+                                    pytest.param(dict(workers=2, executor='process'), marks=fork)])
+def test_bad_files_next_to_good_ones(small_file, tmp_path, kwargs):
+    files = _files(small_file, tmp_path)
+    seen = []
+    results = load_many(files, progress=lambda file, seconds, error: seen.append(file), **kwargs)
+    assert [result.file for result in results] == files
+    assert sorted(seen) == sorted(files)
+    expected = saved(loaded(small_file), tmp_path / 'expected.mzTab')
+    for i in (0, 3):
+        assert results[i].error is None
+        assert saved(results[i].mztab, tmp_path / 'out.mzTab') == expected
+    for i in (1, 2):
+        assert results[i].mztab is None
+        assert 'Traceback' in results[i].error
+
+
+def _dying_load_file(file, kwargs, send=False):
+    # a worker killed while it loads this file
+    if file.endswith('die.mzTab'):
+        os._exit(1)
+    return load_file(file, kwargs, send)
+
+
+@fork
+def test_dead_worker_does_not_abort_the_batch(small_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(mztab, '_load_file', _dying_load_file)
+    files = [small_file, str(tmp_path / 'die.mzTab'), small_file]
+    results = load_many(files, workers=2, executor='process')
+    assert [result.file for result in results] == files
+    assert results[1].mztab is None
+    assert 'BrokenProcessPool' in results[1].error
+    for result in results:
+        assert (result.mztab is None) != (result.error is None)
@@ -0,0 +1,45 @@
+import re
+
+from conftest import loaded, read_bytes, saved
+from pymztab.mztab import merge
+
+
+def _deleted(small_file):
+    m = loaded(small_file)
+    m.samples_delete('patientid', ['P1'])
+    return m
+
+
+def _without_spectra_ref(text):
+    # save() keeps the spectra_ref of the SME rows as in the file, merge() renumbers them
+    lines = text.decode().split('\n')
+    header = next(line for line in lines if line.startswith('SEH')).split('\t')
+    column = header.index('spectra_ref')
+    for i, line in enumerate(lines):
+        if line.startswith('SME\t'):
+            cells = line.split('\t')
+            cells[column] = ''
+            lines[i] = '\t'.join(cells)
+    return lines
+
+
+def test_single_input_merge_equals_save(small_file, tmp_path):
+    expected = saved(_deleted(small_file), tmp_path / 'saved.mzTab')
+    merge([_deleted(small_file)], str(tmp_path / 'merged.mzTab'))
+    merged = read_bytes(str(tmp_path / 'merged.mzTab'))
+    assert _without_spectra_ref(merged) == _without_spectra_ref(expected)
+
+    # the ms_runs of the deleted assays are neither written nor referenced
+    runs = set(re.findall(r'MTD\tms_run\[(\d+)\]-location', merged.decode()))
+    assert runs == {'1', '2', '3', '4'}
+    for line in merged.decode().split('\n'):
+        if line.startswith('SME\t'):
+            assert set(re.findall(r'ms_run\[(\d+)\]', line)) <= runs
+
+
+def test_merge_of_two_inputs(small_file, tmp_path):
+    merge([small_file, small_file], str(tmp_path / 'merged.mzTab'))
+    m = loaded(tmp_path / 'merged.mzTab')
+    assert len(m.samples) == 12
+    assert len(m.assays) == 12
+    assert len(m.sml) == 80
@@ -0,0 +1,28 @@
+import pytest
+
+from conftest import loaded, read_bytes
+
+MODES = [dict(), dict(stream=True), dict(lazy=True), dict(typed=True)]
+
+
+def _mgf_lines(path):
+    lines = read_bytes(path).replace(b'\r\n', b'\n').split(b'\n')
+    return b'\n'.join(line for line in lines if line.startswith(b'COM\tMGF'))
+
+
+@pytest.mark.parametrize('kwargs', MODES)
+def test_mgf_bytes_in_every_load_mode(small_file, kwargs):
+    m = loaded(small_file, **kwargs)
+    assert bytes(m.mgf.raw) == _mgf_lines(small_file)
+    assert len(m.mgf) == 5
+    # the mgf lines are not kept as text too
+    assert not any(isinstance(line, str) and line.startswith('COM\tMGF') for line in m.txt)
+
+
+@pytest.mark.parametrize('kwargs', MODES)
+def test_mgf_of_a_crlf_file(small_file, tmp_path, kwargs):
+    path = tmp_path / 'crlf.mzTab'
+    path.write_bytes(read_bytes(small_file).replace(b'\n', b'\r\n'))
+    m = loaded(path, **kwargs)
+    assert bytes(m.mgf.raw) == _mgf_lines(small_file)
+    assert m.mgf.spectrum(0)['mz'].shape == (4,)
@@ -0,0 +1,72 @@
+import os
+import tracemalloc
+
+from conftest import loaded
+from pymztab.mztab import mzTab
+
+
+def _by_phase(stats, operation):
+    return {s.phase: s for s in stats if s.operation == operation}
+
+
+def test_load_and_save_phases(small_file, tmp_path):
+    seen = []
+    m = mzTab(small_file)
+    stats = m.profile(callback=seen.append)
+    m.load()
+    load = _by_phase(stats, 'load')
+    assert list(load) == ['read', 'classify', 'mgf', 'sml', 'smf', 'sme', 'samples', 'assays']
+    assert load['read'].bytes == os.path.getsize(small_file)
+    assert load['sml'].rows == 40
+    assert load['samples'].rows == 6
+    assert load['assays'].rows == 6
+    assert all(s.seconds >= 0 and s.peak_memory is None for s in stats)
+
+    path = str(tmp_path / 'out.mzTab')
+    m.save(path)
+    save = _by_phase(stats, 'save')
+    assert list(save) == ['metadata', 'sml', 'smf', 'sme', 'mgf', 'close']
+    assert save['sml'].rows == 40
+    assert save['mgf'].bytes >= len(m.mgf.raw)
+    # the metadata and the empty lines are the only bytes not counted by a phase
+    assert 0 < sum(save[name].bytes for name in ('sml', 'smf', 'sme', 'mgf')) < os.path.getsize(path)
+    assert seen == stats
+
+
+def test_materialize_inside_save(small_file, tmp_path):
+    m = loaded(small_file, lazy=True)
+    stats = m.profile(memory=True)
+    m.samples_delete('patientid', ['P1'])
+    m.save(str(tmp_path / 'out.mzTab'))
+    phases = [(s.operation, s.phase) for s in stats]
+    # a phase is recorded when it ends, the tables materialized by save() before the phase of save() they are in
+    assert phases.index(('materialize', 'sml')) < phases.index(('save', 'sml'))
+    materialized, save = _by_phase(stats, 'materialize'), _by_phase(stats, 'save')
+    assert materialized['sml'].rows == 40
+    for name in ('sml', 'smf'):
+        assert materialized[name].peak_memory > 0
+        assert save[name].peak_memory >= materialized[name].peak_memory
+    assert not tracemalloc.is_tracing()
+
+
+def test_profile_disabled(small_file):
+    m = mzTab(small_file)
+    stats = m.profile()
+    m.load()
+    count = len(stats)
+    assert m.profile(enabled=False) is stats
+    m.load()
+    assert len(stats) == count
+    assert m.stats is stats
+
+
+def test_tracemalloc_of_the_caller_is_kept(small_file):
+    tracemalloc.start()
+    try:
+        m = mzTab(small_file)
+        stats = m.profile(memory=True)
+        m.load()
+        assert tracemalloc.is_tracing()
+        assert all(s.peak_memory is not None for s in stats)
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,34 @@
+import pandas as pd
+
+from conftest import loaded, saved
+from generate import generate
+from pymztab import mztab
+from pymztab.mztab import _format_frame
+
+
+def test_round_trip_is_stable(small_file, tmp_path):
+    # the first save renumbers the samples and assays, saving what it wrote again changes nothing
+    first = saved(loaded(small_file), tmp_path / 'first.mzTab')
+    again = loaded(tmp_path / 'first.mzTab')
+    assert saved(again, tmp_path / 'again.mzTab') == first
+    m = loaded(small_file)
+    for name in ('sml', 'smf', 'sme'):
+        pd.testing.assert_frame_equal(getattr(again, name), getattr(m, name), obj=name)
+    assert again.mgf.raw == m.mgf.raw
+
+
+
+def test_format_frame():
+    df = pd.DataFrame({'SML_ID': pd.array([1, None], dtype='Int64'), 'name': ['a', None],
+                       'abundance_assay[1]': [0.1, float('nan')], 'mass': [float('inf'), -float('inf')],
+                       'text': ['None', 'x']})
+    assert _format_frame(df) == [['1', 'null'], ['a', 'null'], ['0.1', 'null'], ['INF', '-INF'], ['null', 'x']]
+
+
+def test_write_table_in_chunks(tmp_path, monkeypatch):
+    # the rows are written a chunk of at least 1000 rows at a time, whatever the size of the chunks
+    path = str(tmp_path / 'rows.mzTab')
+    generate(path, samples=2, sml=2500, mgf=0)
+    expected = saved(loaded(path, typed=True), tmp_path / 'expected.mzTab')
+    monkeypatch.setattr(mztab, 'CHUNK_CELLS', 1)
+    assert saved(loaded(path, typed=True), tmp_path / 'chunked.mzTab') == expected
@@ -0,0 +1,60 @@
+from conftest import loaded
+
+HEADER = 'MTD\tmzTab-version\t2.0.0-M\nMTD\tmzTab-ID\tTEST\n'
+ASSAYS = ('MTD\tms_run[1]-location\tfile:///run1.mzML\n'
+          'MTD\tassay[1]\tassay 1\nMTD\tassay[1]-sample_ref\tsample[1]\nMTD\tassay[1]-ms_run_ref\tms_run[1]\n'
+          'MTD\tassay[2]\tassay 2\nMTD\tassay[2]-sample_ref\tsample[2]\nMTD\tassay[2]-ms_run_ref\tms_run[1]\n\n')
+TABLE = 'SMH\tSML_ID\tabundance_assay[1]\tabundance_assay[2]\nSML\t1\t10\t20\nSML\t2\tnull\t30\n'
+
+
+def _write(path, samples):
+    with open(path, 'w') as f:
+        f.write(HEADER + samples + ASSAYS + TABLE)
+    return str(path)
+
+
+def test_samples_without_descriptions(tmp_path):
+    path = _write(tmp_path / 'nodesc.mzTab', 'MTD\tsample[1]\tsample 1\nMTD\tsample[2]\tsample 2\n')
+    for kwargs in (dict(), dict(stream=True), dict(lazy=True)):
+        m = loaded(path, **kwargs)
+        assert list(m.samples.index) == ['sample[1]', 'sample[2]']
+        assert list(m.samples.columns) == ['description']
+        assert m.samples['description'].isna().all()
+        m.save(str(tmp_path / 'out.mzTab'))
+        out = loaded(tmp_path / 'out.mzTab')
+        assert list(out.samples.index) == ['sample[1]', 'sample[2]']
+
+
+def test_samples_with_empty_descriptions(tmp_path):
+    path = _write(tmp_path / 'empty.mzTab', 'MTD\tsample[1]\tsample 1\nMTD\tsample[1]-description\t\n')
+    m = loaded(path)
+    assert list(m.samples.index) == ['sample[1]']
+
+
+def test_description_keys(tmp_path):
+    path = _write(tmp_path / 'keys.mzTab', 'MTD\tsample[1]-description\tpatientid:P1 | time:10:30\n'
+                                           'MTD\tsample[2]-description\tpatientid:P2\n')
+    m = loaded(path)
+    assert m.samples.loc['sample[1]', 'patientid'] == 'P1'
+    assert m.samples.loc['sample[1]', 'time'] == '10:30'
+    assert m.samples.loc['sample[2]', 'time'] != m.samples.loc['sample[2]', 'time']
+
+
+def test_no_samples(tmp_path):
+    path = _write(tmp_path / 'nosamples.mzTab', '')
+    m = loaded(path)
+    assert len(m.samples) == 0
+
+
+def test_update_sample_without_description(tmp_path):
+    path = _write(tmp_path / 'partial.mzTab', 'MTD\tsample[1]\tsample 1\nMTD\tsample[1]-description\tpatientid:P1\n'
+                                              'MTD\tsample[2]\tsample 2\n')
+    m = loaded(path)
+    m.samples_update('patientid', 'PX')
+    assert list(m.samples['patientid']) == ['PX', 'PX']
+    m.save(str(tmp_path / 'out.mzTab'))
+    out = loaded(tmp_path / 'out.mzTab')
+    assert set(out.samples.index) == {'sample[1]', 'sample[2]'}
+    assert list(out.samples['patientid']) == ['PX', 'PX']
+    with open(str(tmp_path / 'out.mzTab')) as f:
+        assert f.read().count('-description\tpatientid:PX') == 2
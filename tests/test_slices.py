@@ -0,0 +1,37 @@
+import concurrent.futures
+import multiprocessing
+import os
+
+import pytest
+
+from conftest import loaded, read_bytes
+
+fork = pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+
+
+def _slices(small_file, directory, **kwargs):
+    directory.mkdir()
+    loaded(small_file).save_slices(os.path.join(str(directory), 'out.mzTab'), **kwargs)
+    return {name: read_bytes(os.path.join(str(directory), name)) for name in sorted(os.listdir(str(directory)))}
+
+
+@pytest.mark.parametrize('kwargs', [dict(workers=2, executor='thread'),
+                                    pytest.param(dict(workers=2, executor='process'), marks=fork)])
+def test_pools_write_the_serial_slices(small_file, tmp_path, kwargs):
+    expected = _slices(small_file, tmp_path / 'serial')
+    assert sorted(expected) == ['out_patientid__P1.mzTab', 'out_patientid__P2.mzTab', 'out_patientid__P3.mzTab']
+    assert _slices(small_file, tmp_path / 'pool', **kwargs) == expected
+
+
+@pytest.mark.parametrize('method', [m for m in ('fork', 'spawn') if m in multiprocessing.get_all_start_methods()])
+def test_process_executor_is_refused(small_file, tmp_path, method):
+    with concurrent.futures.ProcessPoolExecutor(2, mp_context=multiprocessing.get_context(method)) as executor:
+        with pytest.raises(ValueError):
+            _slices(small_file, tmp_path / 'pool', executor=executor)
+    assert os.listdir(str(tmp_path / 'pool')) == []
+
+
+def test_custom_thread_executor(small_file, tmp_path):
+    expected = _slices(small_file, tmp_path / 'serial')
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        assert _slices(small_file, tmp_path / 'pool', executor=executor) == expected
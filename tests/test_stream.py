@@ -0,0 +1,20 @@
+import pandas as pd
+import pytest
+
+from conftest import loaded, saved
+
+
+@pytest.mark.parametrize('typed', [False, True])
+def test_stream_load_equals_full_load(small_file, tmp_path, typed):
+    full = loaded(small_file, typed=typed)
+    m = loaded(small_file, stream=True, typed=typed)
+    for name in ('samples', 'assays', 'sml', 'smf', 'sme'):
+        pd.testing.assert_frame_equal(getattr(m, name), getattr(full, name), obj=name)
+    assert saved(m, tmp_path / 'stream.mzTab') == saved(full, tmp_path / 'full.mzTab')
+
+
+def test_stream_load_keeps_no_rows_as_text(small_file):
+    m = loaded(small_file, stream=True)
+    assert not any(line.startswith(('SML\t', 'SMF\t', 'SME\t', 'COM\tMGF')) for line in m.txt)
+    assert len(m.lines['sml']) == 0
+    assert len(m.sml) == 40
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import loaded, saved
+from pymztab.mztab import TABLE_DTYPES
+
+
+def test_typed_columns(small_file):
+    m = loaded(small_file, typed=True)
+    text = loaded(small_file)
+    for name, dtypes in TABLE_DTYPES.items():
+        table = getattr(m, name)
+        for column, dtype in dtypes.items():
+            if column in table.columns:
+                assert str(table[column].dtype) == dtype, (name, column)
+        for column in table.columns:
+            if column.startswith('abundance_assay['):
+                assert table[column].dtype == np.float64
+                # null is a missing value
+                assert (table[column].isna() == (getattr(text, name)[column] == 'null')).all()
+    assert m.sml['SML_ID'].tolist() == list(range(1, 41))
+
+
+@pytest.mark.parametrize('mode', [dict(stream=True), dict(lazy=True)])
+def test_typed_load_modes(small_file, mode):
+    full = loaded(small_file, typed=True)
+    m = loaded(small_file, typed=True, **mode)
+    for name in ('sml', 'smf', 'sme'):
+        pd.testing.assert_frame_equal(getattr(m, name), getattr(full, name), obj=name)
+
+
+def test_typed_round_trip_is_stable(small_file, tmp_path):
+    first = saved(loaded(small_file, typed=True), tmp_path / 'first.mzTab')
+    again = loaded(tmp_path / 'first.mzTab', typed=True)
+    assert saved(again, tmp_path / 'again.mzTab') == first
+    m = loaded(small_file, typed=True)
+    for name in ('sml', 'smf', 'sme'):
+        pd.testing.assert_frame_equal(getattr(again, name), getattr(m, name), obj=name)